@@ -0,0 +1,129 @@
+import io
+import math
+import random
+from argparse import ArgumentParser
+from pathlib import Path
+
+# Letter size in points, scanned at 150 dpi
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+SCAN_DPI = 150
+MARGIN = 54
+FONT_SIZE = 10
+LINE_HEIGHT = 14
+WORDS = """
+the of and to in is was for that with as on by at from this be are which or an it were not has have but
+their its also been more other one two first new after all some these into than only when between
+library collection university archive manuscript letter records volume series folder box item page
+""".split()
+
+
+def scan_image(seed: int):
+    """A greyscale page with paper noise, standing in for the scanned page image"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    width, height = PAGE_WIDTH * SCAN_DPI // 72, PAGE_HEIGHT * SCAN_DPI // 72
+    noise = bytes(rng.randrange(225, 256) for _ in range(width * 64))
+    image = Image.frombytes("L", (width, 64), noise).resize((width, height))
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=60)
+    buffer.seek(0)
+    return buffer
+
+
+def draw_text_line(pdf, rng: random.Random, x: float, y: float, width: float, words_per_line: int):
+    # Render mode 3 is invisible text, as OCR software writes it on top of the page image
+    text = pdf.beginText()
+    text.setTextRenderMode(3)
+    text.setFont("Helvetica", FONT_SIZE)
+    text.setTextOrigin(x, y)
+    line = " ".join(rng.choice(WORDS) for _ in range(words_per_line))
+    while len(line) > 1 and pdf.stringWidth(line, "Helvetica", FONT_SIZE) > width:
+        line = line.rsplit(" ", 1)[0]
+    text.textLine(line)
+    pdf.drawText(text)
+
+
+def draw_table(pdf, rng: random.Random, x: float, y: float, width: float, rows: int, columns: int):
+    """Draws a ruled table with its top left corner at (x, y), returning its height"""
+    row_height = LINE_HEIGHT + 6
+    column_width = width / columns
+    pdf.setLineWidth(0.5)
+    for row in range(rows + 1):
+        pdf.line(x, y - row * row_height, x + width, y - row * row_height)
+    for column in range(columns + 1):
+        pdf.line(x + column * column_width, y, x + column * column_width, y - rows * row_height)
+    for row in range(rows):
+        for column in range(columns):
+            draw_text_line(
+                pdf, rng, x + column * column_width + 3, y - (row + 1) * row_height + 6, column_width - 6, 2
+            )
+    return rows * row_height
+
+
+def generate_pdf(
+    pdf_file,
+    pages: int = 10,
+    words_per_line: int = 10,
+    lines: int = 45,
+    tables: int = 0,
+    columns: int = 1,
+    seed: int = 0,
+):
+    """Writes a synthetic scanned PDF: a full-page image per page under an invisible text layer
+
+    Each page has up to lines lines of text of words_per_line words in columns columns,
+    plus tables ruled tables placed between paragraphs of the first column.
+    The same arguments always give the same PDF.
+    """
+    from reportlab.lib.utils import ImageReader
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(seed)
+    image = ImageReader(scan_image(seed))
+    Path(pdf_file).parent.mkdir(parents=True, exist_ok=True)
+    pdf = canvas.Canvas(str(pdf_file), pagesize=(PAGE_WIDTH, PAGE_HEIGHT), invariant=1)
+    gutter = 18
+    column_width = (PAGE_WIDTH - 2 * MARGIN - (columns - 1) * gutter) / columns
+    lines_per_column = math.ceil(lines / columns)
+    for _ in range(pages):
+        pdf.drawImage(image, 0, 0, PAGE_WIDTH, PAGE_HEIGHT)
+        table_lines = sorted(rng.sample(range(1, lines_per_column), min(tables, lines_per_column - 1)))
+        for column in range(columns):
+            x = MARGIN + column * (column_width + gutter)
+            y = PAGE_HEIGHT - MARGIN
+            for line in range(lines_per_column):
+                if y < MARGIN:
+                    break
+                if column == 0 and line in table_lines:
+                    y -= LINE_HEIGHT + draw_table(pdf, rng, x, y, column_width, rng.randint(3, 6), rng.randint(2, 4))
+                    y -= LINE_HEIGHT
+                    continue
+                draw_text_line(pdf, rng, x, y, column_width, words_per_line)
+                # A paragraph break now and then, as the layout analysis groups lines by their spacing
+                y -= LINE_HEIGHT * (3 if rng.random() < 0.1 else 1)
+        pdf.showPage()
+    pdf.save()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Generate a synthetic scanned PDF (a page image under invisible OCR text) for benchmarking.
+        Needs reportlab and Pillow.
+        """,
+    )
+    parser.add_argument("pdf_file", type=str, help="Path of the PDF to write")
+    parser.add_argument("--pages", type=int, default=10, help="Number of pages.")
+    parser.add_argument("--words", type=int, default=10, help="Words per line of text.")
+    parser.add_argument("--lines", type=int, default=45, help="Lines of text per page.")
+    parser.add_argument(
+        "--tables",
+        type=int,
+        default=0,
+        help="Ruled tables per page. Table extraction runs tabula, which needs Java."
+    )
+    parser.add_argument("--columns", type=int, default=1, help="Text columns per page.")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed.")
+    args = parser.parse_args()
+    generate_pdf(args.pdf_file, args.pages, args.words, args.lines, args.tables, args.columns, args.seed)
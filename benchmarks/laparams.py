@@ -0,0 +1,209 @@
+import io
+import json
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ElementTree
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+
+import numpy as np
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+BBOX = re.compile(r"bbox (\d+) (\d+) (\d+) (\d+)")
+
+
+def page_boxes(hocr: str):
+    """Returns the block and word bboxes of an hOCR page, as [left, top, right, bottom] lists and word texts"""
+    blocks, words, texts = [], [], []
+    for element in ElementTree.fromstring(hocr).iter():
+        kind = element.get("class")
+        if kind not in ("ocrx_block", "ocr_table", "ocrx_word"):
+            continue
+        bbox = [int(x) for x in BBOX.match(element.get("title", "")).groups()]
+        if kind == "ocrx_word":
+            words.append(bbox)
+            texts.append(element.text or "")
+        else:
+            blocks.append(bbox)
+    return {"blocks": blocks, "words": words, "texts": texts}
+
+
+def measure(pdf_file, profile: str):
+    """Extracts every page of pdf_file with the named LAParams profile, in this process
+
+    Returns the seconds taken and the boxes of every page's hOCR.
+    """
+    from pdfminer.layout import LAParams
+    from tree_extractor import LAPARAMS_PROFILES, CustomTreeExtractor
+
+    start = time.perf_counter()
+    extractor = CustomTreeExtractor(pdf_file)
+    extractor.laparams = LAParams(**LAPARAMS_PROFILES[profile])
+    pages = {}
+    for page_num in extractor.iter_pages():
+        buffer = io.StringIO()
+        extractor.write_html_for_page(page_num, buffer)
+        pages[page_num] = buffer.getvalue()
+    seconds = time.perf_counter() - start
+    return {"seconds": seconds, "pages": {page_num: page_boxes(hocr) for page_num, hocr in pages.items()}}
+
+
+def run_measure(pdf_file, profile: str, repeat: int):
+    """Measures pdf_file with profile in a fresh process per run, reporting the fastest run"""
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, __file__, "--measure", str(Path(pdf_file).resolve()), "--profile", profile],
+            cwd=REPO,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode:
+            return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+        runs.append(json.loads(process.stdout))
+    return min(runs, key=lambda x: x["seconds"])
+
+
+def best_iou(expected, actual, same=None):
+    """For each expected box, the highest intersection over union with any actual box
+
+    With same, a boolean (expected x actual) matrix, only boxes it allows are compared.
+    """
+    if not len(expected):
+        return np.zeros(0)
+    if not len(actual):
+        return np.zeros(len(expected))
+    expected = np.asarray(expected, dtype=float)[:, None, :]
+    actual = np.asarray(actual, dtype=float)[None, :, :]
+    overlap = np.minimum(expected[..., 2:], actual[..., 2:]) - np.maximum(expected[..., :2], actual[..., :2])
+    intersection = np.clip(overlap, 0, None).prod(axis=-1)
+    area = lambda x: (x[..., 2] - x[..., 0]) * (x[..., 3] - x[..., 1])
+    union = area(expected) + area(actual) - intersection
+    iou = np.divide(intersection, union, out=(intersection == union).astype(float), where=union > 0)
+    if same is not None:
+        iou = np.where(same, iou, 0.0)
+    return iou.max(axis=1)
+
+
+def compare(expected_pages, actual_pages):
+    """How far the blocks and words of actual_pages are from expected_pages
+
+    Reports the counts of both, the mean best IoU of each expected box with an actual box (words only match
+    words with the same text), and the share of expected boxes found with exactly the same bbox.
+    """
+    result = {}
+    for kind in ("blocks", "words"):
+        ious = []
+        counts = [0, 0]
+        for page_num, expected in expected_pages.items():
+            actual = actual_pages.get(page_num, {"blocks": [], "words": [], "texts": []})
+            counts[0] += len(expected[kind])
+            counts[1] += len(actual[kind])
+            same = None
+            if kind == "words" and expected["words"] and actual["words"]:
+                same = np.asarray(expected["texts"])[:, None] == np.asarray(actual["texts"])[None, :]
+            ious.append(best_iou(expected[kind], actual[kind], same))
+        ious = np.concatenate(ious) if ious else np.zeros(0)
+        result[kind] = {
+            "default": counts[0],
+            "profile": counts[1],
+            "mean_iou": float(ious.mean()) if len(ious) else 1.0,
+            "identical": float((ious == 1.0).mean()) if len(ious) else 1.0,
+        }
+    return result
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Compare the LAParams profiles of hocrextract.py --laparams: pages/sec for each, and how much the block and
+        word bboxes of its hOCR differ from those of the default profile.
+        Without PDFs, a synthetic scanned corpus is generated first (see corpus.py).
+        """,
+    )
+    parser.add_argument(
+        "pdf_files",
+        type=str,
+        nargs="*",
+        help="Paths to input PDFs"
+    )
+    parser.add_argument(
+        "--profiles",
+        type=str,
+        default="fast,default,accurate",
+        help="Comma separated profiles to compare."
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=10,
+        help="Pages per generated PDF."
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of runs per PDF and profile; the fastest is reported."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the results as JSON."
+    )
+    # Used by run_measure to measure one PDF in a child process
+    parser.add_argument("--measure", type=str, help=SUPPRESS)
+    parser.add_argument("--profile", type=str, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.profile)))
+        sys.exit()
+    from pipeline import generate_corpus
+
+    profiles = args.profiles.split(",")
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        if args.pdf_files:
+            pdf_files = {pdf_file: pdf_file for pdf_file in args.pdf_files}
+        else:
+            pdf_files = generate_corpus(folder, args.pages, 0)
+        for name, pdf_file in pdf_files.items():
+            runs = {
+                profile: run_measure(pdf_file, profile, args.repeat) for profile in dict.fromkeys(["default"] + profiles)
+            }
+            results[name] = {}
+            for profile in profiles:
+                run = runs[profile]
+                if "error" in run or "error" in runs["default"]:
+                    results[name][profile] = {"error": run.get("error") or runs["default"]["error"]}
+                    continue
+                pages = len(run["pages"])
+                results[name][profile] = {
+                    "pages": pages,
+                    "pages_per_second": pages / run["seconds"] if run["seconds"] else 0.0,
+                    "speedup": runs["default"]["seconds"] / run["seconds"] if run["seconds"] else 0.0,
+                    **compare(runs["default"]["pages"], run["pages"]),
+                }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, profile_results in results.items():
+            for profile, result in profile_results.items():
+                label = f"{name} ({profile})"
+                if "error" in result:
+                    print(f"{label:<32} {result['error']}")
+                    continue
+                print(
+                    f"{label:<32} {result['pages_per_second']:>7.2f} pages/s   x{result['speedup']:.2f}"
+                    + "".join(
+                        f"   {kind} {result[kind]['profile']:>5}/{result[kind]['default']:<5}"
+                        f" IoU {result[kind]['mean_iou']:.3f} same {result[kind]['identical']:>6.1%}"
+                        for kind in ("blocks", "words")
+                    )
+                )
@@ -0,0 +1,186 @@
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import SUPPRESS, ArgumentParser
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+# name -> generate_pdf arguments, for the corpus used when no PDFs are given
+CORPUS = {
+    "one column": {},
+    "two columns": {"columns": 2},
+    "dense": {"words_per_line": 16, "lines": 60},
+    "sparse": {"words_per_line": 4, "lines": 20},
+    "tables": {"tables": 2},
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def measure(pdf_file, use_mmap=False, text_layer=False, lean=False):
+    """Times the stages of extracting every page of pdf_file in this process"""
+    from tree_extractor import CustomTreeExtractor
+
+    seconds = {}
+    start = time.perf_counter()
+    extractor = CustomTreeExtractor(pdf_file)
+    extractor.use_mmap = use_mmap
+    extractor.text_layer = text_layer
+    extractor.lean = lean
+    extractor.parse()
+    seconds["parse"] = time.perf_counter() - start
+    start = time.perf_counter()
+    extractor.get_tree_structure(None, None)
+    seconds["get_tree_structure"] = time.perf_counter() - start
+    start = time.perf_counter()
+    pages = list(extractor.get_elems().keys())
+    for page_num in pages:
+        extractor.get_html_for_page(page_num)
+    seconds["get_html_for_page"] = time.perf_counter() - start
+    total = sum(seconds.values())
+    return {
+        "pages": len(pages),
+        "seconds": seconds,
+        "pages_per_second": len(pages) / total if total else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def run_measure(pdf_file, repeat: int, use_mmap=False, text_layer=False, lean=False):
+    """Measures pdf_file in a fresh process per run, so imports and peak RSS are not shared between runs
+
+    Reports the fastest run and the highest peak RSS.
+    """
+    runs = []
+    for _ in range(repeat):
+        process = subprocess.run(
+            [sys.executable, __file__, "--measure", str(Path(pdf_file).resolve())]
+            + (["--mmap"] if use_mmap else [])
+            + (["--text-layer"] if text_layer else [])
+            + (["--lean"] if lean else []),
+            cwd=REPO,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+        )
+        if process.returncode:
+            return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+        runs.append(json.loads(process.stdout))
+    best = max(runs, key=lambda x: x["pages_per_second"])
+    best["peak_rss_mb"] = max(x["peak_rss_mb"] for x in runs)
+    return best
+
+
+def generate_corpus(folder, pages: int, seed: int):
+    from corpus import generate_pdf
+
+    pdf_files = {}
+    for name, arguments in CORPUS.items():
+        pdf_file = Path(folder, name.replace(" ", "_") + ".pdf")
+        generate_pdf(pdf_file, pages=pages, seed=seed, **arguments)
+        pdf_files[name] = pdf_file
+    return pdf_files
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Measure pages/sec, peak RSS and the time spent in parse, get_tree_structure and get_html_for_page.
+        Without PDFs, a synthetic scanned corpus is generated first (see corpus.py).
+        """,
+    )
+    parser.add_argument(
+        "pdf_files",
+        type=str,
+        nargs="*",
+        help="Paths to input PDFs"
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=10,
+        help="Pages per generated PDF."
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed for the generated PDFs."
+    )
+    parser.add_argument(
+        "--corpus",
+        type=str,
+        help="Folder to keep the generated PDFs in, instead of a temporary folder."
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of runs per PDF; the fastest is reported."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the results as JSON."
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="Also measure every PDF memory-mapped (hocrextract.py --mmap) and report the speedup."
+    )
+    parser.add_argument(
+        "--text-layer",
+        action="store_true",
+        help="Also measure every PDF with its text layer read directly (hocrextract.py --text-layer)."
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="Also measure every PDF with the lean aggregator (hocrextract.py --lean)."
+    )
+    # Used by run_measure to measure one PDF in a child process
+    parser.add_argument("--measure", type=str, help=SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        print(json.dumps(measure(args.measure, args.mmap, args.text_layer, args.lean)))
+        sys.exit()
+    with tempfile.TemporaryDirectory() as folder:
+        if args.pdf_files:
+            pdf_files = {pdf_file: pdf_file for pdf_file in args.pdf_files}
+        else:
+            pdf_files = generate_corpus(args.corpus or folder, args.pages, args.seed)
+        results = {name: run_measure(pdf_file, args.repeat) for name, pdf_file in pdf_files.items()}
+        variants = {"mmap": {"use_mmap": True}, "text layer": {"text_layer": True}, "lean": {"lean": True}}
+        for variant, arguments in variants.items():
+            if not getattr(args, variant.replace(" ", "_")):
+                continue
+            for name, pdf_file in pdf_files.items():
+                result = results[f"{name} ({variant})"] = run_measure(pdf_file, args.repeat, **arguments)
+                if "error" not in result and "error" not in results[name]:
+                    result["parse_speedup"] = results[name]["seconds"]["parse"] / result["seconds"]["parse"]
+                    result["speedup"] = result["pages_per_second"] / results[name]["pages_per_second"]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            if "error" in result:
+                print(f"{name:<29} {result['error']}")
+                continue
+            stages = "   ".join(f"{stage} {seconds:>7.3f} s" for stage, seconds in result["seconds"].items())
+            speedup = f"   speedup x{result['speedup']:.2f} (parse x{result['parse_speedup']:.2f})" if (
+                "speedup" in result
+            ) else ""
+            print(
+                f"{name:<29} {result['pages']:>5} pages   {result['pages_per_second']:>7.2f} pages/s"
+                f"   peak {result['peak_rss_mb']:>7.1f} MB   {stages}{speedup}"
+            )
@@ -0,0 +1,90 @@
+import io
+import json
+import statistics
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+# name -> (renderer, compact)
+MODES = {
+    "stream pretty": ("stream", False),
+    "stream compact": ("stream", True),
+    "minidom pretty": ("minidom", False),
+    "minidom compact": ("minidom", True),
+}
+
+
+def render(extractor, page_num: int, renderer: str, compact: bool):
+    if renderer == "minidom":
+        return extractor.get_html_for_page(page_num, compact)
+    buffer = io.StringIO()
+    extractor.write_html_for_page(page_num, buffer, compact)
+    return buffer.getvalue()
+
+
+def benchmark_pdf(pdf_file, repeat: int):
+    """Returns, per mode, the bytes and best render time of every page of pdf_file"""
+    from tree_extractor import CustomTreeExtractor
+
+    extractor = CustomTreeExtractor(pdf_file)
+    extractor.parse()
+    extractor.get_tree_structure(None, None)
+    results = {name: [] for name in MODES}
+    for page_num in extractor.get_elems().keys():
+        for name, (renderer, compact) in MODES.items():
+            timings = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                page_html = render(extractor, page_num, renderer, compact)
+                timings.append(time.perf_counter() - start)
+            results[name].append({
+                "page": page_num,
+                "bytes": len(page_html.encode("utf-8")),
+                "render_ms": round(min(timings) * 1000, 3),
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Report bytes written and render time per page for pretty and compact hOCR,
+        with both the streaming and the minidom renderer.
+        """,
+    )
+    parser.add_argument(
+        "pdf_files",
+        type=str,
+        nargs="+",
+        help="Paths to input PDFs"
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=3,
+        help="Number of renders per page; the fastest is reported."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print per-page results as JSON."
+    )
+    args = parser.parse_args()
+    results = {pdf_file: benchmark_pdf(pdf_file, args.repeat) for pdf_file in args.pdf_files}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for pdf_file, modes in results.items():
+            print(pdf_file)
+            for name, pages in modes.items():
+                total_bytes = sum(x["bytes"] for x in pages)
+                print(
+                    f"  {name:<16} {len(pages):>5} pages"
+                    f"   {total_bytes / max(len(pages), 1):>10.0f} bytes/page"
+                    f"   median {statistics.median(x['render_ms'] for x in pages) if pages else 0:>8.3f} ms/page"
+                )
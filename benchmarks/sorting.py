@@ -0,0 +1,179 @@
+import json
+import random
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from functools import cmp_to_key
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO))
+
+
+def page_lists(pdf_file):
+    """Yields the boxes of every page of pdf_file and the text lines inside each box, as get_html_for_page sorts them"""
+    from pdftotree.ml.features import get_mentions_within_bbox
+    from tree_extractor import CustomTreeExtractor
+
+    extractor = CustomTreeExtractor(pdf_file)
+    extractor.parse()
+    extractor.get_tree_structure(None, None)
+    for page_num in extractor.get_elems().keys():
+        page_boxes = extractor.get_page_boxes(page_num)
+        yield "boxes", [[label, *box] for label, box in page_boxes]
+        for label, box in page_boxes:
+            if label != "table":
+                yield "elems", get_mentions_within_bbox(box, extractor.elems[page_num].mentions)
+
+
+def synthetic_lists(rng: random.Random, count: int):
+    """Yields pages of boxes in rows and columns, every other page with the jitter of real layouts"""
+    for page in range(count):
+        rows, columns = rng.randint(1, 120), rng.randint(1, 4)
+        jitter = [0, 0, 0, 0.4, 0.5, 1.5] if page % 2 else [0]
+        boxes = []
+        for row in range(rows):
+            for column in range(columns):
+                top = row * 14 + rng.choice(jitter)
+                left = column * 150 + rng.choice([0, 0, rng.uniform(0, 20)])
+                boxes.append(["paragraph", top, left, top + rng.choice([10, 10, 12]), left + 140])
+        yield "boxes", boxes
+
+
+def compare(kind: str, items, rng: random.Random, shuffles: int, min_vector_size: int):
+    """Sorts items, and shuffled copies of them, with both the comparator and box_order
+
+    Orders are checked with box_order.MIN_VECTOR_SIZE at 0, so the key-based path is checked on every list it can
+    sort, however short; box_order is timed with min_vector_size as its threshold.
+    Returns (lists sorted, lists sorted by key, seconds with the comparator, seconds with box_order),
+    or None when an order differs.
+    """
+    import box_order
+    from pdftotree.utils.pdf.vector_utils import column_order, reading_order
+
+    comparator = column_order if kind == "boxes" else reading_order
+    sort = box_order.sort_boxes if kind == "boxes" else box_order.sort_elems
+    counts = [0, 0, 0.0, 0.0]
+    for attempt in range(shuffles + 1):
+        items = list(items)
+        if attempt:
+            rng.shuffle(items)
+        start = time.perf_counter()
+        expected = sorted(items, key=cmp_to_key(comparator))
+        counts[2] += time.perf_counter() - start
+        box_order.MIN_VECTOR_SIZE = 0
+        actual = list(items)
+        sort(actual)
+        box_order.MIN_VECTOR_SIZE = min_vector_size
+        if [id(x) for x in actual] != [id(x) for x in expected]:
+            return None
+        actual = list(items)
+        start = time.perf_counter()
+        sort(actual)
+        counts[3] += time.perf_counter() - start
+        counts[0] += 1
+        if items and box_order.row_order(
+            *zip(*[(x[1], x[2], x[3]) if kind == "boxes" else (x.bbox[1], x.bbox[0], x.bbox[3]) for x in items])
+        ) is not None:
+            counts[1] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Check that box_order sorts boxes and text lines exactly as the column_order and reading_order comparators do,
+        on the pages of the given PDFs (or a generated corpus) and on synthetic pages, and compare their speed.
+        Exits with status 1 if any order differs, or if no list of a PDF could be sorted by key.
+        """,
+    )
+    parser.add_argument(
+        "pdf_files",
+        type=str,
+        nargs="*",
+        help="Paths to input PDFs"
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=10,
+        help="Pages per generated PDF."
+    )
+    parser.add_argument(
+        "--synthetic",
+        type=int,
+        default=500,
+        help="Number of synthetic pages."
+    )
+    parser.add_argument(
+        "--shuffles",
+        type=int,
+        default=5,
+        help="Shuffled copies sorted per list."
+    )
+    parser.add_argument(
+        "--min-vector-size",
+        type=int,
+        help="""
+        Override box_order.MIN_VECTOR_SIZE for timing, e.g. 0 to time the vectorized path on every list.
+        Orders are always checked with the vectorized path on every list.
+        """
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+    import box_order
+    from pipeline import generate_corpus
+
+    min_vector_size = box_order.MIN_VECTOR_SIZE if args.min_vector_size is None else args.min_vector_size
+    rng = random.Random(0)
+    results = {}
+    mismatches = []
+    with tempfile.TemporaryDirectory() as folder:
+        sources = {name: page_lists(pdf_file) for name, pdf_file in (
+            {pdf_file: pdf_file for pdf_file in args.pdf_files} or generate_corpus(folder, args.pages, 0)
+        ).items()}
+        sources["synthetic"] = synthetic_lists(rng, args.synthetic)
+        for name, lists in sources.items():
+            result = results[name] = {
+                "lists": 0, "sorted": 0, "sorted_by_key": 0, "comparator_seconds": 0.0, "box_order_seconds": 0.0,
+            }
+            try:
+                for kind, items in lists:
+                    counts = compare(kind, items, rng, args.shuffles, min_vector_size)
+                    result["lists"] += 1
+                    if counts is None:
+                        mismatches.append((name, kind, len(items)))
+                        continue
+                    for key, count in zip(
+                        ["sorted", "sorted_by_key", "comparator_seconds", "box_order_seconds"], counts
+                    ):
+                        result[key] += count
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+    # PDFs on which the vectorized path was never taken, so nothing was checked
+    unchecked = [
+        name for name, result in results.items()
+        if name != "synthetic" and "error" not in result and not result["sorted_by_key"]
+    ]
+    if args.json:
+        print(json.dumps({"results": results, "mismatches": mismatches, "unchecked": unchecked}, indent=2))
+    else:
+        for name, result in results.items():
+            if "error" in result:
+                print(f"{name:<16} {result['error']}")
+                continue
+            print(
+                f"{name:<16} {result['sorted']:>6} sorts ({result['sorted_by_key']} by key)"
+                f"   comparator {result['comparator_seconds'] * 1000:>9.1f} ms"
+                f"   box_order {result['box_order_seconds'] * 1000:>9.1f} ms"
+            )
+        for name, kind, size in mismatches:
+            print(f"MISMATCH {name}: {kind} of {size}")
+        for name in unchecked:
+            print(f"UNCHECKED {name}: no list was sorted by key")
+    sys.exit(1 if mismatches or unchecked else 0)
@@ -0,0 +1,59 @@
+import json
+import statistics
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+from pathlib import Path
+
+REPO = Path(__file__).resolve().parent.parent
+
+# name -> command, run from the repository folder
+CASES = {
+    "help": [sys.executable, "hocrextract.py", "--help"],
+    "argument error": [sys.executable, "hocrextract.py", "--workers", "0", "missing.pdf"],
+    "import tree_extractor": [sys.executable, "-c", "import tree_extractor"],
+}
+
+
+def time_command(command, repeat: int):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, cwd=REPO, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Measure the wall time of starting hocrextract.py for --help and argument errors,
+        next to the time it takes to import the pdftotree/pdfminer stack.
+        """,
+    )
+    parser.add_argument(
+        "-n",
+        "--repeat",
+        type=int,
+        default=10,
+        help="Number of runs per case."
+    )
+    parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print the results as JSON."
+    )
+    args = parser.parse_args()
+    results = {}
+    for name, command in CASES.items():
+        timings = time_command(command, args.repeat)
+        results[name] = {
+            "min_ms": round(min(timings) * 1000, 1),
+            "median_ms": round(statistics.median(timings) * 1000, 1),
+        }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for name, result in results.items():
+            print(f"{name:<24} min {result['min_ms']:>8.1f} ms   median {result['median_ms']:>8.1f} ms")
@@ -0,0 +1,95 @@
+from functools import cmp_to_key
+
+import numpy as np
+from pdftotree.utils.pdf.vector_utils import column_order, reading_order
+
+# Below this many boxes, building the arrays costs more than comparing in Python
+MIN_VECTOR_SIZE = 64
+
+def _pair_count(group_ids):
+    sizes = np.bincount(group_ids)
+    return int((sizes * (sizes - 1) // 2).sum())
+
+def row_order(tops, lefts, bottoms):
+    """Sorts boxes the way pdftotree's column_order and reading_order comparators do, with one key per box
+
+    The comparators put two boxes in the same row when their rounded tops or rounded bottoms are equal and
+    order them by left, and otherwise order them by top. That is only a consistent ordering when every group
+    of boxes linked through shared tops and bottoms is entirely in one row, and the groups do not overlap
+    vertically; then sorting by (row, left) gives exactly the order a stable sort with the comparator gives.
+    Returns the indexes of the boxes in that order, or None when the comparator is inconsistent for these
+    boxes, as the result of sorting with it then depends on the original order.
+    """
+    tops = np.asarray(tops, dtype=float)
+    lefts = np.asarray(lefts, dtype=float)
+    bottoms = np.asarray(bottoms, dtype=float)
+    if not (np.isfinite(tops).all() and np.isfinite(lefts).all() and np.isfinite(bottoms).all()):
+        return None
+    # np.rint rounds half to even, as round() does
+    top_ids = np.unique(np.rint(tops), return_inverse=True)[1].ravel()
+    bottom_ids = np.unique(np.rint(bottoms), return_inverse=True)[1].ravel()
+    # Label every box with the smallest top group it is linked to through shared tops and bottoms
+    labels = top_ids
+    while True:
+        by_bottom = np.full(bottom_ids.max() + 1, len(tops))
+        np.minimum.at(by_bottom, bottom_ids, labels)
+        by_top = np.full(top_ids.max() + 1, len(tops))
+        np.minimum.at(by_top, top_ids, by_bottom[bottom_ids])
+        new_labels = by_top[top_ids]
+        if (new_labels == labels).all():
+            break
+        labels = new_labels
+    rows = np.unique(labels, return_inverse=True)[1].ravel()
+    # Every pair of boxes in a row must share a rounded top or bottom
+    linked_pairs = (
+        _pair_count(top_ids)
+        + _pair_count(bottom_ids)
+        - _pair_count(top_ids * (bottom_ids.max() + 1) + bottom_ids)
+    )
+    if linked_pairs != _pair_count(rows):
+        return None
+    # The tops of different rows must not interleave
+    row_count = rows.max() + 1
+    min_tops = np.full(row_count, np.inf)
+    np.minimum.at(min_tops, rows, tops)
+    max_tops = np.full(row_count, -np.inf)
+    np.maximum.at(max_tops, rows, tops)
+    by_min_top = np.argsort(min_tops, kind="stable")
+    if (max_tops[by_min_top][:-1] >= min_tops[by_min_top][1:]).any():
+        return None
+    row_ranks = np.empty(row_count, dtype=int)
+    row_ranks[by_min_top] = np.arange(row_count)
+    # lexsort is stable, so boxes the comparator finds equal keep their order
+    return np.lexsort((lefts, row_ranks[rows]))
+
+def sort_order(tops, lefts, bottoms):
+    """Returns the indexes of boxes in the order the column_order comparator sorts them in"""
+    if len(tops) >= MIN_VECTOR_SIZE:
+        order = row_order(tops, lefts, bottoms)
+        if order is not None:
+            return order
+    # column_order only looks at the top, left and bottom, at indexes 1 to 3
+    tops, lefts, bottoms = [np.asarray(x, dtype=float).tolist() for x in (tops, lefts, bottoms)]
+    boxes = [(index, *box) for index, box in enumerate(zip(tops, lefts, bottoms))]
+    boxes.sort(key=cmp_to_key(column_order))
+    return np.array([x[0] for x in boxes], dtype=int)
+
+def sort_boxes(boxes):
+    """Sorts [type, top, left, bottom, right] boxes in place, as boxes.sort(key=cmp_to_key(column_order))"""
+    order = None
+    if len(boxes) >= MIN_VECTOR_SIZE:
+        order = row_order([x[1] for x in boxes], [x[2] for x in boxes], [x[3] for x in boxes])
+    if order is None:
+        boxes.sort(key=cmp_to_key(column_order))
+    else:
+        boxes[:] = [boxes[x] for x in order]
+
+def sort_elems(elems):
+    """Sorts layout elements in place, as elems.sort(key=cmp_to_key(reading_order))"""
+    order = None
+    if len(elems) >= MIN_VECTOR_SIZE:
+        order = row_order([x.bbox[1] for x in elems], [x.bbox[0] for x in elems], [x.bbox[3] for x in elems])
+    if order is None:
+        elems.sort(key=cmp_to_key(reading_order))
+    else:
+        elems[:] = [elems[x] for x in order]
@@ -0,0 +1,21 @@
+import sys
+from argparse import ArgumentParser
+from hocrextract import open_hocr
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="""
+        Write hOCR files produced by hocrextract.py to stdout, decompressing gzip or zstd output
+        """,
+    )
+    parser.add_argument(
+        "hocr_files",
+        type=str,
+        nargs="+",
+        help="Paths to hOCR files"
+    )
+    args = parser.parse_args()
+    for hocr_file in args.hocr_files:
+        with open_hocr(hocr_file) as file:
+            for chunk in iter(lambda: file.read(1 << 16), ""):
+                sys.stdout.write(chunk)
@@ -1,125 +1,965 @@
-import codecs
+import atexit
+import cProfile
+import glob
+import gzip
+import hashlib
+import io
+import json
 import logging
+import math
+import multiprocessing
 import os
-from typing import List
-import pdftotree
-from argparse import ArgumentParser
-from functools import cmp_to_key
+import pickle
+import queue
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from argparse import ArgumentParser, ArgumentTypeError
+from collections import Counter, deque
+from contextlib import closing, nullcontext
+from functools import partial
 from pathlib import Path
-from pdfminer.layout import LAParams, LTPage, LTFigure, LTImage
-from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
-from pdfminer.pdfpage import PDFPage
-from pdfminer.pdfparser import PDFParser
-from pdftotree import TreeExtract
-from pdftotree.utils.pdf.pdf_utils import CustomPDFPageAggregator
-from pdftotree.utils.pdf.vector_utils import column_order
-from xml.dom.minidom import Document
-
-class CustomTreeExtractor(TreeExtract.TreeExtractor):
-    """Extracts HOCR info to separate files and scales based on the size of the bg image"""
-
-    def parse(self):
-        layouts: List[LTPage] = []
-        log = logging.getLogger(__name__)
-
-        # Open a PDF file.
-        with open(os.path.realpath(self.pdf_file), "rb") as fp:
-            # Create a PDF parser object associated with the file object.
-            parser = PDFParser(fp)
-            # Create a PDF document object that stores the document structure.
-            # Supply the password for initialization.
-            document = PDFDocument(parser, password="")
-            # Create a PDF resource manager object that stores shared resources.
-            rsrcmgr = PDFResourceManager()
-            # Set parameters for analysis.
-            laparams = LAParams(char_margin=1.0, word_margin=0.1, detect_vertical=True)
-            # Create a PDF page aggregator object.
-            device = CustomPDFPageAggregator(rsrcmgr, laparams=laparams)
-            # Create a PDF interpreter object.
-            interpreter = PDFPageInterpreter(rsrcmgr, device)
-            # Process each page contained in the document.
-            for page_num, page in enumerate(PDFPage.create_pages(document)):
-                try:
-                    interpreter.process_page(page)
-                except OverflowError as oe:
-                    log.exception(
-                        "{}, skipping page {} of {}".format(oe, page_num, self.pdf_file)
+from typing import Collection, Dict, NamedTuple, Optional, Union
+
+# pdftotree and pdfminer are slow to import, so tree_extractor is only imported once there is work to do
+
+COMPRESSION_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+PDF_MAGIC = b"%PDF-"
+MANIFEST_NAME = "hocrextract_manifest.tsv"
+# A PDF read from stdin is kept in memory up to this size, and spooled to a temporary file beyond it
+STDIN_MEMORY_LIMIT = 256 * 1024 * 1024
+ARCHIVE_SUFFIXES = {
+    ("tar", None): ".tar",
+    ("tar", "gzip"): ".tar.gz",
+    ("tar", "zstd"): ".tar.zst",
+    ("zip", None): ".zip",
+    ("zip", "gzip"): ".zip",
+}
+
+class Options(NamedTuple):
+    """How pages are extracted and rendered, passed along to worker processes"""
+    renderer: str = "stream"
+    # Name of the LAParams profile, in tree_extractor.LAPARAMS_PROFILES
+    laparams: str = "default"
+    compact: bool = False
+    cache: Optional[str] = None
+    cache_size: int = 0
+    mmap: bool = False
+    text_layer: bool = False
+    lean: bool = False
+    profile: bool = False
+    # With profile, profile pages separately and keep those slower than this many seconds
+    profile_slower_than: Optional[float] = None
+
+# (folder, max_bytes) -> LayoutCache, kept for the life of the process so that worker processes do not count
+# the cache folder again for every chunk
+_layout_caches = {}
+
+def make_extractor(pdf_file, options: Options, pdf_hash=None):
+    from pdfminer.layout import LAParams
+    from tree_extractor import LAPARAMS_PROFILES, CustomTreeExtractor, LayoutCache
+
+    extractor = CustomTreeExtractor(pdf_file)
+    extractor.known_pdf_hash = pdf_hash
+    extractor.laparams = LAParams(**LAPARAMS_PROFILES[options.laparams])
+    extractor.use_mmap = options.mmap
+    extractor.text_layer = options.text_layer
+    extractor.lean = options.lean
+    if options.cache:
+        key = (options.cache, options.cache_size)
+        if key not in _layout_caches:
+            _layout_caches[key] = LayoutCache(options.cache, options.cache_size)
+        extractor.cache = _layout_caches[key]
+    return extractor
+
+def render_page(extractor, page_num: int, file, options: Options):
+    if options.renderer == "minidom":
+        file.write(extractor.get_html_for_page(page_num, options.compact))
+    else:
+        extractor.write_html_for_page(page_num, file, options.compact)
+
+def render_page_to_string(extractor, page_num: int, options: Options):
+    buffer = io.StringIO()
+    render_page(extractor, page_num, buffer, options)
+    return buffer.getvalue()
+
+def page_record(extractor, page_num: int):
+    """Counts and stage timings of a page, for RunReport"""
+    return {
+        "page": page_num,
+        **extractor.page_counts(page_num),
+        "seconds": dict(extractor.timings.get(page_num, {})),
+    }
+
+def iter_hocr(source, pids=None, pages=None, name=None, options: Options = Options()):
+    """Extracts hOCR in this process, yielding (page_num, pid, hocr) one page at a time
+
+    source is a path, the PDF as bytes, or a binary file object. pids lists the PID of every page, as a PID file
+    does; without it, PIDs are {name}-{page_num:04}, where name defaults to the file name of source.
+    If pages is given, only those (1-based) page numbers are extracted. Nothing is written to disk, except that
+    tabula copies the PDF to a temporary file to read a table from one held in memory.
+    """
+    extractor = make_extractor(source, options)
+    if name is None:
+        name = extractor.name if isinstance(source, (str, os.PathLike)) or hasattr(source, "name") else "document"
+    for page_num in extractor.iter_pages(pages):
+        yield page_num, page_pid(pids, name, page_num), render_page_to_string(extractor, page_num, options)
+
+class Job(NamedTuple):
+    """A PDF to extract: the pages wanted (None for all), minus those an earlier run already wrote"""
+    # A path, or the bytes of a PDF read from stdin
+    pdf_file: Union[str, bytes]
+    pages: Optional[Collection[int]] = None
+    # page_num -> ref_page_seen after that page, for pages an earlier run already wrote (None when not resuming)
+    done: Optional[Dict[int, bool]] = None
+    # sha256 of the PDF, hashed once for all its chunks when there is a --cache
+    pdf_hash: Optional[str] = None
+
+    def select_pages(self, page_count: int, name):
+        """Returns the pages of a page_count page document to extract, in order
+
+        Requested pages past its end are skipped with a warning; if none of them is in it, ValueError is raised.
+        """
+        if self.pages is None:
+            pages = range(1, page_count + 1)
+        else:
+            pages = sorted(x for x in set(self.pages) if 1 <= x <= page_count)
+            missing = sorted(x for x in set(self.pages) if x > page_count)
+            if not pages:
+                raise ValueError(f"{name} has {page_count} pages, so none of the requested pages can be extracted")
+            if missing:
+                logging.getLogger(__name__).warning(
+                    "{} has {} pages, skipping requested pages {}".format(
+                        name, page_count, ",".join(str(x) for x in missing)
                     )
-                    continue
-                layout = device.get_result()
-                layouts.append(layout)
-
-        for page_num, layout in enumerate(layouts):
-            page_num += 1  # indexes start at 1
-            bg_figure = next(x for x in layout._objs if isinstance(x, LTFigure) and x.width == layout.width)
-            bg_image = next(x for x in bg_figure._objs if isinstance(x, LTImage))
-            scale_factor = bg_image.srcsize[0] / layout.width
-            elems, font_stat = device.normalize_pdf(layout, scale_factor)
-            self.elems[page_num] = elems
-            self.font_stats[page_num] = font_stat
-
-    def get_html_for_page(self, page_num: int):
-        doc = Document()
-        self.doc = doc
-        html = doc.createElement("html")
-        doc.appendChild(html)
-        html.setAttribute("xmlns", "http://www.w3.org/1999/xhtml")
-        head = doc.createElement("head")
-        html.appendChild(head)
-        # meta
-        meta = doc.createElement("meta")
-        head.appendChild(meta)
-        meta.setAttribute("name", "ocr-system")
-        meta.setAttribute("content", f"Extracted from PDF by hocrextract/pdftotree {pdftotree.__version__}")
-        meta = doc.createElement("meta")
-        head.appendChild(meta)
-        meta.setAttribute("name", "ocr-capabilities")
-        meta.setAttribute("content", "ocr_page ocr_table ocrx_block ocrx_word")
-        # body
-        body = doc.createElement("body")
-        html.appendChild(body)
-        boxes = []
-        for clust in self.tree[page_num]:
-            for (pnum, pwidth, pheight, top, left, bottom, right) in self.tree[
-                page_num
-            ][clust]:
-                boxes += [
-                    [clust.lower().replace(" ", "_"), top, left, bottom, right]
-                ]
-        page = doc.createElement("div")
-        page.setAttribute("class", "ocr_page")
-        page.setAttribute("id", "page_1")
-        width = int(self.elems[page_num].layout.width)
-        height = int(self.elems[page_num].layout.height)
-        page.setAttribute(
-            "title",
-            f"bbox 0 0 {width} {height}; ppageno 0",
-        )
-        body.appendChild(page)
-        boxes.sort(key=cmp_to_key(column_order))
-
-        for box in boxes:
-            if box[0] == "table":
-                table = box[1:]  # bbox
-                table_element = self.get_html_table(table, page_num)
-                page.appendChild(table_element)
-            elif box[0] == "figure":
-                fig_element = doc.createElement("figure")
-                page.appendChild(fig_element)
-                top, left, bottom, right = [int(i) for i in box[1:]]
-                fig_element.setAttribute(
-                    "title", f"bbox {left} {top} {right} {bottom}"
                 )
-            else:
-                element = self.get_html_others(box[0], box[1:], page_num)
-                page.appendChild(element)
-        return doc.toprettyxml()
-    
+        if self.done:
+            pages = [x for x in pages if x not in self.done]
+        return pages
+
+    def ref_page_seen_after(self):
+        return min((page_num for page_num, seen in (self.done or {}).items() if seen), default=None)
+
+def _document_tasks(jobs, workers: int, options: Options):
+    from tree_extractor import count_pages, hash_pdf
+
+    log = logging.getLogger(__name__)
+    for index, job in enumerate(jobs):
+        try:
+            page_count = count_pages(job.pdf_file, options.mmap)
+            if options.cache and job.pdf_hash is None:
+                job = job._replace(pdf_hash=hash_pdf(job.pdf_file, options.mmap))
+        except Exception:
+            log.exception("Unable to read the pages of {}".format(job.pdf_file))
+            yield index, job, None, False, options
+            continue
+        try:
+            pages = job.select_pages(page_count, job.pdf_file)
+        except ValueError as e:
+            log.error(e)
+            yield index, job, None, False, options
+            continue
+        chunk_size = max(1, math.ceil(len(pages) / (workers * 4)))
+        for start in range(0, len(pages), chunk_size):
+            yield index, job, pages[start:start + chunk_size], False, options
+
+def _extract_chunk(task):
+    """Extracts a chunk of pages in a worker process
+
+    Returns the task, the pages as (page_num, html, ref_page_seen, page_record) (None on failure),
+    the ref_page_seen state after the chunk and, with options.profile, the chunk's stats dict
+    or the slow pages of a PageProfiler.
+    """
+    from hocrprofile import PageProfiler, Profiler, profiler_active
+
+    index, job, pages, ref_page_seen, options = task
+    if pages is None:
+        return task, None, ref_page_seen, None
+    # A profiler that is already running (the parent's, when a chunk is redone there) covers this chunk
+    profile = options.profile and not profiler_active()
+    page_profiler = profile and options.profile_slower_than is not None and PageProfiler(options.profile_slower_than)
+    chunk_profiler = profile and not page_profiler and Profiler()
+    try:
+        if chunk_profiler:
+            chunk_profiler.enable()
+        extractor = make_extractor(job.pdf_file, options, job.pdf_hash)
+        extractor.ref_page_seen = ref_page_seen
+        extractor.ref_page_seen_after = job.ref_page_seen_after()
+        results = []
+        page_nums = extractor.iter_pages(pages)
+        if page_profiler:
+            page_nums = page_profiler.iter_pages(page_nums)
+        with closing(page_nums):
+            for page_num in page_nums:
+                start = time.perf_counter()
+                page_html = render_page_to_string(extractor, page_num, options)
+                record = page_record(extractor, page_num)
+                record["seconds"]["render"] = time.perf_counter() - start
+                results.append((page_num, page_html, extractor.ref_page_seen, record))
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "Failed to extract pages {}-{} of {}".format(pages[0], pages[-1], job.pdf_file)
+        )
+        return task, None, ref_page_seen, None
+    finally:
+        if chunk_profiler:
+            chunk_profiler.disable()
+    if chunk_profiler:
+        chunk_profiler.create_stats()
+        return task, results, extractor.ref_page_seen, chunk_profiler.stats
+    if page_profiler:
+        return task, results, extractor.ref_page_seen, page_profiler.slow_pages
+    return task, results, extractor.ref_page_seen, None
+
+def iter_chunks_parallel(jobs, workers: int, options: Options):
+    """Yields (index, pages, profile) for chunks of the pages of every job, extracted by one pool of worker processes
+
+    Chunks come in job and page order; pages and profile are as returned by _extract_chunk.
+    Each worker opens the PDF itself. Every chunk starts as if no references section has been seen yet;
+    a chunk following one where it was seen is extracted again with the right state, so the output
+    matches a serial run.
+    """
+    from hocrprofile import stop_inherited_profiler
+
+    current_index = None
+    ref_page_seen = False
+    with multiprocessing.Pool(workers, initializer=options.profile and stop_inherited_profiler or None) as pool:
+        for task, pages, chunk_ref_page_seen, profile in pool.imap(
+            _extract_chunk, _document_tasks(jobs, workers, options)
+        ):
+            index, job, chunk, _, _ = task
+            if index != current_index:
+                current_index = index
+                ref_page_seen = False
+            if ref_page_seen and pages is not None:
+                _, pages, chunk_ref_page_seen, profile = _extract_chunk((index, job, chunk, True, options))
+            yield index, pages, profile
+            ref_page_seen = chunk_ref_page_seen
+
+def _interpret_chunk(task):
+    """Interprets a chunk of pages in an interpret worker process
+
+    Returns the task, the pickled list of (page_num, page) with pages from CustomTreeExtractor.pop_parsed_page
+    (None on failure) and, with options.profile, the chunk's stats dict. The pages stay pickled until a render
+    worker renders them, so the parent process only holds bytes for the chunks in between.
+    """
+    from hocrprofile import Profiler, profiler_active
+
+    index, job, pages, ref_page_seen, options = task
+    if pages is None:
+        return task, None, None
+    chunk_profiler = options.profile and not profiler_active() and Profiler()
+    try:
+        if chunk_profiler:
+            chunk_profiler.enable()
+        extractor = make_extractor(job.pdf_file, options, job.pdf_hash)
+        interpreted = pickle.dumps(
+            [(page_num, extractor.pop_parsed_page(page_num)) for page_num in extractor.iter_parse(pages, caching=False)],
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "Failed to interpret pages {}-{} of {}".format(pages[0], pages[-1], job.pdf_file)
+        )
+        return task, None, None
+    finally:
+        if chunk_profiler:
+            chunk_profiler.disable()
+    if chunk_profiler:
+        chunk_profiler.create_stats()
+        return task, interpreted, chunk_profiler.stats
+    return task, interpreted, None
+
+def _render_chunk(task, interpreted):
+    """Builds the trees of a chunk of pages pickled by _interpret_chunk and renders them, in a render worker process
+
+    Returns the same as _extract_chunk.
+    """
+    from hocrprofile import Profiler, profiler_active
+
+    index, job, pages, ref_page_seen, options = task
+    chunk_profiler = options.profile and not profiler_active() and Profiler()
+    try:
+        if chunk_profiler:
+            chunk_profiler.enable()
+        extractor = make_extractor(job.pdf_file, options, job.pdf_hash)
+        extractor.ref_page_seen = ref_page_seen
+        extractor.ref_page_seen_after = job.ref_page_seen_after()
+        results = []
+        for page_num, page in pickle.loads(interpreted):
+            extractor.add_parsed_page(page_num, page)
+            # Build the tree first, as iter_pages does, so its time is not counted as rendering as well
+            extractor.get_page_boxes(page_num)
+            start = time.perf_counter()
+            page_html = render_page_to_string(extractor, page_num, options)
+            record = page_record(extractor, page_num)
+            record["seconds"]["render"] = time.perf_counter() - start
+            results.append((page_num, page_html, extractor.ref_page_seen, record))
+            extractor.free_page(page_num)
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "Failed to render pages {}-{} of {}".format(pages[0], pages[-1], job.pdf_file)
+        )
+        return task, None, ref_page_seen, None
+    finally:
+        if chunk_profiler:
+            chunk_profiler.disable()
+    if chunk_profiler:
+        chunk_profiler.create_stats()
+        return task, results, extractor.ref_page_seen, chunk_profiler.stats
+    return task, results, extractor.ref_page_seen, None
+
+def iter_chunks_staged(jobs, interpret_workers: int, render_workers: int, queue_size: int, options: Options):
+    """Yields (index, pages, profile) like iter_chunks_parallel, with interpreting and rendering on separate pools
+
+    interpret_workers processes interpret chunks of pages (pdfminer and normalize_pdf), and render_workers
+    processes build their trees and render them. Besides the chunks the workers are busy with, at most queue_size
+    interpreted chunks wait for a render worker and at most queue_size rendered chunks wait to be written, so a
+    slow stage holds back the one before it instead of letting pages pile up in memory.
+    As in iter_chunks_parallel, chunks are rendered as if no references section has been seen yet and rendered
+    again, from the interpreted pages kept until then, when that was wrong.
+    """
+    from hocrprofile import merge_stats, stop_inherited_profiler
+
+    tasks = _document_tasks(jobs, max(interpret_workers, render_workers), options)
+    initializer = options.profile and stop_inherited_profiler or None
+    # AsyncResults of _interpret_chunk, in chunk order
+    interpreting = deque()
+    # (task, interpreted pages, interpret profile, AsyncResult of _render_chunk or None), in chunk order
+    rendering = deque()
+    current_index = None
+    ref_page_seen = False
+    with multiprocessing.Pool(interpret_workers, initializer=initializer) as interpret_pool, \
+            multiprocessing.Pool(render_workers, initializer=initializer) as render_pool:
+        while True:
+            while len(interpreting) < interpret_workers + queue_size:
+                task = next(tasks, None)
+                if task is None:
+                    break
+                interpreting.append(interpret_pool.apply_async(_interpret_chunk, (task,)))
+            # Only wait for an interpreted chunk when no rendered one can be written in the meantime
+            while interpreting and len(rendering) < render_workers + queue_size and (
+                not rendering or interpreting[0].ready()
+            ):
+                task, interpreted, profile = interpreting.popleft().get()
+                render = interpreted is not None and render_pool.apply_async(_render_chunk, (task, interpreted))
+                rendering.append((task, interpreted, profile, render))
+            if not rendering:
+                break
+            task, interpreted, interpret_profile, render = rendering.popleft()
+            index, job, chunk, _, _ = task
+            if index != current_index:
+                current_index = index
+                ref_page_seen = False
+            pages, chunk_ref_page_seen, render_profile = None, False, None
+            if render:
+                _, pages, chunk_ref_page_seen, render_profile = render.get()
+                if ref_page_seen and pages is not None:
+                    _, pages, chunk_ref_page_seen, render_profile = _render_chunk(
+                        (index, job, chunk, True, options), interpreted
+                    )
+            profiles = [x for x in (interpret_profile, render_profile) if x]
+            yield index, pages, profiles and merge_stats(profiles).stats or None
+            ref_page_seen = chunk_ref_page_seen
+
+def read_stdin(memory_limit: int):
+    """Reads a PDF from stdin, returning its bytes, or the path of a temporary file if it is larger than memory_limit
+
+    The temporary file is removed when the run ends.
+    """
+    data = sys.stdin.buffer.read(memory_limit + 1)
+    if len(data) <= memory_limit:
+        return data
+    with tempfile.NamedTemporaryFile(prefix="hocrextract-", suffix=".pdf", delete=False) as file:
+        atexit.register(os.unlink, file.name)
+        file.write(data)
+        shutil.copyfileobj(sys.stdin.buffer, file)
+    return file.name
+
+def is_pdf(path):
+    if Path(path).suffix.lower() == ".pdf":
+        return True
+    with open(path, "rb") as file:
+        return file.read(len(PDF_MAGIC)) == PDF_MAGIC
+
+def read_batch(source, pids_folder=None):
+    """Lists (pdf_file, pids_file) for a folder of PDFs, a glob pattern, a manifest file or a single PDF
+
+    A manifest has one PDF path per line, optionally followed by a tab and the path of its PID file.
+    For folders, globs and PDFs, PID files are looked up in pids_folder as {stem}.txt.
+    Raises UnicodeDecodeError for a file that is neither a PDF nor a manifest.
+    """
+    path = Path(source)
+    if path.is_file() and not is_pdf(path):
+        documents = []
+        with open(path) as file:
+            for line in file.read().splitlines():
+                if line.strip():
+                    pdf_file, _, pids_file = line.partition("\t")
+                    documents.append((pdf_file, pids_file or None))
+        return documents
+    if path.is_file():
+        pdf_files = [source]
+    elif path.is_dir():
+        pdf_files = sorted(str(x) for x in path.iterdir() if x.suffix.lower() == ".pdf")
+    else:
+        pdf_files = sorted(glob.glob(source))
+    documents = []
+    for pdf_file in pdf_files:
+        pids_file = pids_folder and Path(pids_folder, f"{Path(pdf_file).stem}.txt")
+        documents.append((pdf_file, str(pids_file) if pids_file and pids_file.is_file() else None))
+    return documents
+
+def parse_pages(spec: str):
+    """Parses a page list such as "400-410,415" into a sorted list of 1-based page numbers"""
+    pages = set()
+    for part in spec.split(","):
+        first, _, last = part.strip().partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            raise ArgumentTypeError(f"invalid page range: {part!r}")
+        if first < 1 or last < first:
+            raise ArgumentTypeError(f"invalid page range: {part!r}")
+        pages.update(range(first, last + 1))
+    return sorted(pages)
+
 def read_pids(pids_file):
     with open(pids_file) as file:
         return file.read().splitlines()
 
+def page_pid(pids, pdf_file, page_num):
+    return pids[page_num - 1].replace(':', '_') if pids else "{}-{}".format(
+        Path(pdf_file).stem,
+        str(page_num).zfill(4)
+    )
+
+class _ChecksumFile(io.RawIOBase):
+    # Hashes the bytes of a page file as they are written, so the manifest does not have to read the file back
+    def __init__(self, file):
+        self.file = file
+        self.digest = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.digest.update(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        if not self.closed:
+            super().close()
+            self.file.close()
+
+class _PageFile(io.TextIOWrapper):
+    # The text of a page file, written through a compressor or buffer; closes the file under it once that is closed
+    def __init__(self, stream, file: _ChecksumFile):
+        super().__init__(stream, encoding="utf-8", newline="")
+        self.file = file
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            self.file.close()
+
+def open_page(output_folder, pid, compress=None):
+    """Opens a page file for writing text; its file.digest is the sha256 of the bytes written to it"""
+    output_path = Path(output_folder, page_filename(pid, compress))
+    file = _ChecksumFile(open(output_path, "wb"))
+    if compress == "gzip":
+        # Named like gzip.open names it, for the original file name in the header
+        return _PageFile(gzip.GzipFile(str(output_path), mode="wb", fileobj=file), file)
+    if compress == "zstd":
+        import zstandard
+
+        return _PageFile(zstandard.ZstdCompressor().stream_writer(file), file)
+    return _PageFile(io.BufferedWriter(file), file)
+
+def page_filename(pid, compress=None):
+    return f"{pid}_HOCR.shtml{COMPRESSION_SUFFIXES.get(compress, '')}"
+
+class DirectoryOutput:
+    """Writes each page to its own file in output_folder"""
+
+    def __init__(self, output_folder, compress=None):
+        self.output_folder = output_folder
+        self.compress = compress
+        # pid -> sha256 of the bytes of its page file, complete once the file is closed
+        self.digests = {}
+        Path(output_folder).mkdir(parents=True, exist_ok=True)
+
+    def open_page(self, pid):
+        page = open_page(self.output_folder, pid, self.compress)
+        self.digests[pid] = page.file.digest
+        return page
+
+    def write_page(self, pid, page_html):
+        with self.open_page(pid) as file:
+            file.write(page_html)
+
+    def checksum(self, pid):
+        """Returns the sha256 of a page file that has been written and closed"""
+        return self.digests.pop(pid).hexdigest()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+class _SequentialFile(io.RawIOBase):
+    # Refuses to seek or tell, so zipfile writes data descriptors instead of going back to patch headers
+    def __init__(self, file):
+        self.file = file
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+class _PageBuffer(io.StringIO):
+    # Hands the rendered page to on_close, once the caller is done writing it
+    def __init__(self, on_close):
+        super().__init__()
+        self.on_close = on_close
+
+    def close(self):
+        if not self.closed:
+            self.on_close(self.getvalue())
+        super().close()
+
+class ArchiveOutput:
+    """Appends each page to a single tar or zip stream, with the member names DirectoryOutput would use as file names
+
+    --compress applies to the whole tar stream (.tar.gz, .tar.zst) or, for zip, deflates each member.
+    archive_path may also be a binary file that is already open, such as stdout, which is flushed but not closed.
+    """
+
+    def __init__(self, archive_path, archive, compress=None):
+        self.archive = archive
+        self.owns_file = isinstance(archive_path, (str, os.PathLike))
+        self.file = open(archive_path, "wb") if self.owns_file else archive_path
+        if archive == "zip":
+            self.stream = None
+            self.zip = zipfile.ZipFile(
+                _SequentialFile(self.file),
+                mode="w",
+                compression=zipfile.ZIP_DEFLATED if compress else zipfile.ZIP_STORED,
+            )
+        elif compress == "zstd":
+            import zstandard
+
+            self.stream = zstandard.ZstdCompressor().stream_writer(self.file, closefd=self.owns_file)
+            self.tar = tarfile.open(fileobj=self.stream, mode="w|")
+        else:
+            self.stream = None
+            self.tar = tarfile.open(fileobj=self.file, mode="w|gz" if compress == "gzip" else "w|")
+
+    def open_page(self, pid):
+        return _PageBuffer(lambda page_html: self.write_page(pid, page_html))
+
+    def checksum(self, pid):
+        return None  # members are not listed in a manifest
+
+    def write_page(self, pid, page_html):
+        data = page_html.encode("utf-8")
+        name = page_filename(pid)
+        if self.archive == "zip":
+            info = zipfile.ZipInfo(name, date_time=time.localtime()[:6])
+            info.compress_type = self.zip.compression
+            self.zip.writestr(info, data)
+        else:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        if self.archive == "zip":
+            self.zip.close()
+        else:
+            self.tar.close()
+        if self.stream is not None:
+            self.stream.close()
+        if self.owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def page_output(output_folder, archive=None, compress=None):
+    """Where the pages of one PDF go: output_folder itself, an archive named after it, or an archive on stdout for -"""
+    if not archive:
+        return DirectoryOutput(output_folder, compress)
+    if str(output_folder) == "-":
+        return ArchiveOutput(sys.stdout.buffer, archive, compress)
+    archive_path = Path(f"{output_folder}{ARCHIVE_SUFFIXES[archive, compress]}")
+    archive_path.parent.mkdir(parents=True, exist_ok=True)
+    return ArchiveOutput(archive_path, archive, compress)
+
+class PageWriter:
+    """Writes rendered pages to a DirectoryOutput or ArchiveOutput on a background thread
+
+    Up to queue_size pages wait to be written; write_page blocks while the queue is full. Once a page is written,
+    its on_written callback is called on the writer thread with the seconds the write took and the output's
+    checksum of the page. If a write fails, the next write_page or close raises that error.
+    With queue_size 0, pages are written right away instead,
+    and render_page renders them straight into their output file.
+    With profile, the writer thread runs its own profiler, whose stats dict is in stats once the writer is closed,
+    before Python 3.12; from 3.12 the run's profiler covers the writer thread already.
+    """
+
+    def __init__(self, output, queue_size: int, profile=False):
+        self.output = output
+        self.error = None
+        self.thread = None
+        self.profile = profile
+        self.stats = None
+        if queue_size > 0:
+            self.queue = queue.Queue(queue_size)
+            self.thread = threading.Thread(target=self._run, name="hocrextract-writer", daemon=True)
+            self.thread.start()
+
+    def _write(self, pid, page_html, on_written):
+        start = time.perf_counter()
+        self.output.write_page(pid, page_html)
+        checksum = self.output.checksum(pid)
+        if on_written is not None:
+            on_written(time.perf_counter() - start, checksum)
+
+    def _run(self):
+        from hocrprofile import PROFILES_ALL_THREADS
+
+        # Before Python 3.12, cProfile only profiles the thread that enables it
+        profiler = self.profile and not PROFILES_ALL_THREADS and cProfile.Profile()
+        if profiler:
+            profiler.enable()
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if self.error is not None:
+                    continue  # keep taking pages, so write_page does not block, until close
+                try:
+                    self._write(*item)
+                except BaseException as e:
+                    self.error = e
+        finally:
+            if profiler:
+                profiler.disable()
+                profiler.create_stats()
+                self.stats = profiler.stats
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    def write_page(self, pid, page_html, on_written=None):
+        if self.thread is None:
+            self._write(pid, page_html, on_written)
+            return
+        self._raise_error()
+        self.queue.put((pid, page_html, on_written))
+
+    def render_page(self, pid, render):
+        """Writes a page that render(file) renders into file; render returns the page's on_written callback
+
+        Without a writer thread, the page is rendered straight into its output file, and the write is the time
+        it takes to close it; otherwise it is rendered into a string for the writer thread.
+        """
+        if self.thread is None:
+            with self.output.open_page(pid) as file:
+                on_written = render(file)
+                start = time.perf_counter()
+            checksum = self.output.checksum(pid)
+            if on_written is not None:
+                on_written(time.perf_counter() - start, checksum)
+            return
+        buffer = io.StringIO()
+        on_written = render(buffer)
+        self.write_page(pid, buffer.getvalue(), on_written)
+
+    def close(self):
+        try:
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+        finally:
+            self.output.close()
+        self._raise_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return
+        # Let the exception that is already on its way out win over a write error
+        try:
+            self.close()
+        except Exception:
+            pass
+
+def file_checksum(path):
+    try:
+        with open(path, "rb") as file:
+            return hashlib.sha256(file.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+class Manifest:
+    """Lists the page files of an output folder that were completely written, for --resume
+
+    Each line holds the page number, file name, sha256 of the file and the ref_page_seen state after the page,
+    separated by tabs. A line is only appended once its file is closed.
+    """
+
+    def __init__(self, output_folder):
+        self.output_folder = output_folder
+        self.path = Path(output_folder, MANIFEST_NAME)
+        self.file = None
+
+    def completed_pages(self, filename_for_page):
+        """Returns {page_num: ref_page_seen} for listed pages whose file still has the expected name and checksum"""
+        done = {}
+        if not self.path.is_file():
+            return done
+        with open(self.path) as file:
+            for line in file.read().splitlines():
+                fields = line.split("\t")
+                if len(fields) != 4:
+                    continue  # cut short by an interrupted run
+                page_num, filename, checksum, ref_page_seen = fields
+                page_num = int(page_num)
+                if filename == filename_for_page(page_num) and file_checksum(Path(self.output_folder, filename)) == checksum:
+                    done[page_num] = ref_page_seen == "1"
+        return done
+
+    def add(self, page_num: int, filename: str, checksum: str, ref_page_seen: bool):
+        if self.file is None:
+            self.file = open(self.path, "a")
+        self.file.write(f"{page_num}\t{filename}\t{checksum}\t{int(ref_page_seen)}\n")
+        self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def compact(self):
+        """Closes the manifest and rewrites it with only the last line of each page, once a run is done with it
+
+        Every run appends to it, and a page written again gets another line, so it would otherwise only grow.
+        """
+        self.close()
+        if not self.path.is_file():
+            return
+        lines = {}
+        with open(self.path) as file:
+            for line in file.read().splitlines():
+                fields = line.split("\t")
+                if len(fields) == 4:
+                    lines[int(fields[0])] = line
+        compacted = self.path.with_name(f"{MANIFEST_NAME}.tmp")
+        with open(compacted, "w") as file:
+            file.writelines(f"{lines[page_num]}\n" for page_num in sorted(lines))
+        os.replace(compacted, self.path)
+
+class RunReport:
+    """Per-page counts and stage timings of one PDF, written as JSON next to its output"""
+
+    def __init__(self, pdf_file, output_folder):
+        self.pdf_file = pdf_file
+        self.path = Path(f"{output_folder}.report.json")
+        self.pages = []
+        self.start = time.perf_counter()
+
+    def add_page(self, pid, record, write_seconds: float):
+        record["pid"] = pid
+        record["seconds"]["write"] = write_seconds
+        self.pages.append(record)
+
+    def write(self):
+        totals = {}
+        for record in self.pages:
+            for stage, seconds in record["seconds"].items():
+                totals[stage] = totals.get(stage, 0.0) + seconds
+        report = {
+            "pdf_file": str(self.pdf_file),
+            "page_count": len(self.pages),
+            "wall_seconds": time.perf_counter() - self.start,
+            "total_seconds": totals,
+            "total_chars": sum(x["chars"] for x in self.pages),
+            "total_boxes": sum(x["boxes"] for x in self.pages),
+            "pages": self.pages,
+        }
+        with open(self.path, "w") as file:
+            json.dump(report, file, indent=2)
+
+def open_hocr(path):
+    """Opens an hOCR file for reading as text, whether it was written plain, gzip or zstd compressed"""
+    with open(path, "rb") as file:
+        magic = file.read(len(ZSTD_MAGIC))
+    if magic.startswith(GZIP_MAGIC):
+        return gzip.open(path, mode="rt", encoding="utf-8", newline="")
+    if magic == ZSTD_MAGIC:
+        import zstandard
+
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"))
+        return io.TextIOWrapper(reader, encoding="utf-8", newline="")
+    return open(path, encoding="utf-8", newline="")
+
+def read_hocr(path):
+    with open_hocr(path) as file:
+        return file.read()
+
+def write_page_profiles(slow_pages, output_folder, pids, pdf_file):
+    from hocrprofile import merge_stats, write_profile
+
+    for page_num, (seconds, stats) in slow_pages.items():
+        pid = page_pid(pids, pdf_file, page_num)
+        write_profile(
+            merge_stats([stats]),
+            Path(output_folder, f"profile-{pid}"),
+            f"{pdf_file} page {page_num} ({seconds:.1f}s)",
+        )
+
+def page_written(
+    args, report, manifest, pid, page_num: int, record, ref_page_seen: bool, write_seconds: float, checksum
+):
+    """Adds a page to the run report and, outside archives, the manifest, once PageWriter has written it"""
+    if args.report:
+        report.add_page(pid, record, write_seconds)
+    if checksum is not None:
+        manifest.add(page_num, page_filename(pid, args.compress), checksum, ref_page_seen)
+
+def extract_parallel(documents, jobs, args, options: Options, run_profiler=None):
+    """Extracts jobs on a pool of args.workers processes, returning the PDFs that failed"""
+    failed = set()
+    output, manifest, output_index = None, None, None
+    if args.interpret_workers or args.render_workers:
+        chunks = iter_chunks_staged(
+            jobs,
+            args.interpret_workers or args.workers,
+            args.render_workers or args.workers,
+            args.stage_queue,
+            options,
+        )
+    else:
+        chunks = iter_chunks_parallel(jobs, args.workers, options)
+
+    def close_output():
+        output.close()
+        if output.stats:
+            run_profiler.add_worker_stats(output.stats)
+        manifest.compact()
+        if args.report:
+            report.write()
+
+    for index, pages, profile in chunks:
+        pdf_file, output_folder, pids_file = documents[index]
+        if pages is None:
+            failed.add(pdf_file)
+            continue
+        if index != output_index:
+            if output:
+                close_output()
+            output = PageWriter(
+                page_output(output_folder, args.archive, args.compress), args.write_queue, bool(run_profiler)
+            )
+            output_index = index
+            manifest = Manifest(output_folder)
+            report = RunReport(pdf_file, output_folder)
+            pids = pids_file and read_pids(pids_file)
+        for page_num, page_html, ref_page_seen, record in pages:
+            pid = page_pid(pids, pdf_file, page_num)
+            output.write_page(
+                pid, page_html, partial(page_written, args, report, manifest, pid, page_num, record, ref_page_seen)
+            )
+        if profile and options.profile_slower_than is not None:
+            write_page_profiles(profile, output_folder, pids, pdf_file)
+        elif profile:
+            run_profiler.add_worker_stats(profile)
+    if output:
+        close_output()
+    return failed
+
+def extract_serial(document, job: Job, args, options: Options, run_profiler=None):
+    """Extracts a single PDF in this process, returning it in a set if it failed, as extract_parallel does"""
+    from hocrprofile import PageProfiler
+    from tree_extractor import count_pages
+
+    pdf_file, output_folder, pids_file = document
+    extractor = make_extractor(job.pdf_file, options, job.pdf_hash)
+    pids = pids_file and read_pids(pids_file)
+    if job.pages is not None or job.done is not None:
+        extractor.ref_page_seen_after = job.ref_page_seen_after()
+        try:
+            pages = extractor.iter_pages(job.select_pages(count_pages(job.pdf_file, options.mmap), pdf_file))
+        except ValueError as e:
+            logging.getLogger(__name__).error(e)
+            return {pdf_file}
+    elif args.stream or args.report or options.profile_slower_than is not None:
+        pages = extractor.iter_pages()
+    else:
+        extractor.parse()
+        pages = extractor.iter_parsed_pages()
+    if options.profile_slower_than is not None:
+        page_profiler = PageProfiler(options.profile_slower_than)
+        pages = page_profiler.iter_pages(pages)
+    manifest = Manifest(output_folder)
+    report = RunReport(pdf_file, output_folder)
+
+    def render(file):
+        start = time.perf_counter()
+        render_page(extractor, page_num, file, options)
+        record = None
+        if args.report:
+            record = page_record(extractor, page_num)
+            record["seconds"]["render"] = time.perf_counter() - start
+        return partial(page_written, args, report, manifest, pid, page_num, record, extractor.ref_page_seen)
+
+    output = PageWriter(page_output(output_folder, args.archive, args.compress), args.write_queue, bool(run_profiler))
+    with output:
+        for page_num in pages:
+            pid = page_pid(pids, pdf_file, page_num)
+            output.render_page(pid, render)
+    if output.stats:
+        run_profiler.add_worker_stats(output.stats)
+    manifest.compact()
+    if args.report:
+        report.write()
+    if options.profile_slower_than is not None:
+        write_page_profiles(page_profiler.slow_pages, output_folder, pids, pdf_file)
+    return set()
+
 if __name__ == "__main__":
     parser = ArgumentParser(
         description="""
@@ -129,7 +969,19 @@ if __name__ == "__main__":
     parser.add_argument(
         "pdf_file",
         type=str,
-        help="Path to input PDF"
+        nargs="?",
+        help="Path to input PDF, or - to read it from stdin"
+    )
+    parser.add_argument(
+        "-b",
+        "--batch",
+        type=str,
+        help="""
+        Extract many PDFs in one run: a folder of PDFs, a glob pattern, or a manifest file listing one PDF per line,
+        optionally followed by a tab and its PID file. A single PDF is a batch of one.
+        Every page of every PDF is scheduled on one pool of --workers processes.
+        Each PDF gets a folder named after it inside the output folder, so their file names must be distinct.
+        """
     )
     parser.add_argument(
         "-o",
@@ -138,27 +990,290 @@ if __name__ == "__main__":
         help="""
         Path to output folder.
         If not given, a folder will be created in the current working directory based on the input filename.
+        With --archive, - writes the archive to stdout.
         """
     )
     parser.add_argument(
         "-p",
         "--pids",
         type=str,
-        help="File containing PIDs corresponding to each page of the input PDF, one per line."
+        help="""
+        File containing PIDs corresponding to each page of the input PDF, one per line.
+        With --batch, a folder of such files named after each PDF ({stem}.txt).
+        """
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="""
+        Process one page at a time (interpret, build the tree, write) instead of analysing the whole PDF first.
+        Keeps memory use at roughly one page regardless of the document length.
+        """
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes to split the pages of the PDF across."
+    )
+    parser.add_argument(
+        "--interpret-workers",
+        type=int,
+        help="""
+        Run interpretation (pdfminer and layout normalization) and rendering (trees and hOCR) on separate pools,
+        with this many interpret worker processes. Defaults to --workers when only --render-workers is given.
+        """
+    )
+    parser.add_argument(
+        "--render-workers",
+        type=int,
+        help="""
+        Number of render worker processes when interpretation and rendering run on separate pools.
+        Defaults to --workers when only --interpret-workers is given.
+        """
+    )
+    parser.add_argument(
+        "--stage-queue",
+        type=int,
+        default=2,
+        metavar="CHUNKS",
+        help="""
+        With separate pools, how many chunks of pages may wait for the next stage (render, then write)
+        beyond those the workers are busy with, before the stage feeding it pauses.
+        """
+    )
+    parser.add_argument(
+        "--renderer",
+        choices=["stream", "minidom"],
+        default="stream",
+        help="""
+        How hOCR is rendered: stream writes each element as it goes, straight to the output file with
+        --write-queue 0 (otherwise to the page handed to the writer thread), minidom builds a DOM per page first
+        and is kept as a reference for checking the streamed output.
+        """
+    )
+    parser.add_argument(
+        "--compact",
+        action="store_true",
+        help="Write hOCR without indentation and line breaks."
+    )
+    parser.add_argument(
+        "--compress",
+        choices=sorted(COMPRESSION_SUFFIXES),
+        help="""
+        Compress each output file, adding .gz or .zst to its name.
+        zstd needs the zstandard package. Use hocrcat.py or open_hocr() to read the files back.
+        """
+    )
+    parser.add_argument(
+        "--archive",
+        choices=["tar", "zip"],
+        help="""
+        Write all pages of a PDF into a single archive named after the output folder (e.g. vol1.tar),
+        instead of one file per page. Members keep the per-page file names.
+        With --compress, a tar archive is compressed as a whole and zip members are deflated.
+        """
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"""
+        Skip the pages already recorded in {MANIFEST_NAME} in the output folder, so an interrupted run can be
+        continued. Every run without --archive records each page there, with its checksum, once it is completely
+        written, so the first run needs no flag. Only the missing pages are interpreted.
+        """
+    )
+    parser.add_argument(
+        "--cache",
+        type=str,
+        help="""
+        Folder for a cache of analysed page layouts, keyed by PDF content, page and layout parameters.
+        Reruns that only change output settings skip layout analysis for cached pages.
+        """
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=1024,
+        help="Size limit of the --cache folder in MB; least recently used pages are removed beyond it."
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="""
+        Memory-map input PDFs instead of reading them through file objects, so the parser's many seeks and reads
+        are served from the page cache; worker processes on the same PDF share its pages.
+        """
+    )
+    parser.add_argument(
+        "--laparams",
+        choices=["fast", "default", "accurate"],
+        default="default",
+        help="""
+        Layout analysis profile. fast skips vertical text detection and the hierarchical grouping of text boxes;
+        accurate also analyses text inside figures. benchmarks/laparams.py compares their speed and output.
+        """
+    )
+    parser.add_argument(
+        "--text-layer",
+        action="store_true",
+        help="""
+        Read the words of the OCR text layer straight from the text-showing operators, one line per run of text,
+        instead of running pdfminer's layout analysis on every character. Much faster on OCR'd scans; lines of
+        text that are not drawn in reading order may be split differently.
+        """
+    )
+    parser.add_argument(
+        "--lean",
+        action="store_true",
+        help="""
+        Drop lines, curves and image data that the hOCR does not depend on as soon as pages draw them,
+        keeping only what sets the width of the page's content. Saves memory and time on vector-heavy pages.
+        """
+    )
+    parser.add_argument(
+        "--pages",
+        type=parse_pages,
+        help="""
+        Only extract these pages, e.g. 400-410,415. Pages are numbered from 1 and keep their
+        absolute numbers (and PIDs) in the output file names. Other pages are not interpreted.
+        Pages past the end of a PDF are skipped with a warning, and a PDF with none of the pages fails.
+        """
+    )
+    parser.add_argument(
+        "--report",
+        action="store_true",
+        help="""
+        Write {output}.report.json with per-page character and box counts and the seconds spent interpreting,
+        normalizing, building the tree, rendering and writing each page.
+        """
+    )
+    parser.add_argument(
+        "--write-queue",
+        type=int,
+        default=8,
+        metavar="PAGES",
+        help="""
+        Pages are written on a background thread while the next ones are rendered; at most this many rendered pages
+        wait to be written before rendering pauses. 0 renders each page straight into its output file before
+        rendering the next, as does --profile-slower-than, so that writes count towards each page's profile.
+        """
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="""
+        Profile the whole extraction with cProfile, including worker processes, and write profile.pstats and
+        profile.speedscope.json (a flame graph for https://www.speedscope.app) to the output folder,
+        or to the --output folder with --batch.
+        """
+    )
+    parser.add_argument(
+        "--profile-slower-than",
+        type=float,
+        metavar="SECONDS",
+        help="""
+        With --profile, profile each page on its own instead, and only write profile-{pid}.pstats and
+        profile-{pid}.speedscope.json for pages that took longer than this.
+        """
     )
     args = parser.parse_args()
-    output_folder = args.output or Path(args.pdf_file).stem
-    Path(output_folder).mkdir(parents=True, exist_ok=True)
-    extractor = CustomTreeExtractor(args.pdf_file)
-    extractor.parse()
-    extractor.get_tree_structure(None, None)
-    pids = args.pids and read_pids(args.pids)
-    for page_num in extractor.get_elems().keys():
-        page_html = extractor.get_html_for_page(page_num)
-        pid = pids[page_num - 1].replace(':', '_') if pids else "{}-{}".format(
-            Path(args.pdf_file).stem,
-            str(page_num).zfill(4)
+    if bool(args.pdf_file) == bool(args.batch):
+        parser.error("give either pdf_file or --batch")
+    if args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.write_queue < 0:
+        parser.error("--write-queue must not be negative")
+    staged = args.interpret_workers is not None or args.render_workers is not None
+    if staged:
+        if min(x for x in (args.interpret_workers, args.render_workers) if x is not None) < 1:
+            parser.error("--interpret-workers and --render-workers must be at least 1")
+        if args.stage_queue < 0:
+            parser.error("--stage-queue must not be negative")
+        if args.profile_slower_than is not None:
+            parser.error("--profile-slower-than cannot be combined with --interpret-workers or --render-workers")
+    if args.compress == "zstd":
+        try:
+            import zstandard
+        except ImportError:
+            parser.error("--compress zstd needs the zstandard package")
+    if args.cache_size < 1:
+        parser.error("--cache-size must be at least 1")
+    if args.profile_slower_than is not None and not args.profile:
+        parser.error("--profile-slower-than needs --profile")
+    if args.profile_slower_than is not None:
+        # Pages are profiled on the thread that renders them, so they are written there too
+        args.write_queue = 0
+    if args.resume and args.archive:
+        parser.error("--resume cannot be combined with --archive")
+    if args.archive and (args.archive, args.compress) not in ARCHIVE_SUFFIXES:
+        parser.error(f"--archive {args.archive} does not support --compress {args.compress}")
+    if args.output == "-":
+        if not args.archive:
+            parser.error("-o - writes an archive to stdout and needs --archive")
+        if args.batch:
+            parser.error("-o - cannot be combined with --batch")
+        if args.report or args.profile:
+            parser.error("--report and --profile need an output folder")
+    stdin_pdf = None
+    if args.batch:
+        try:
+            batch = read_batch(args.batch, args.pids)
+        except UnicodeDecodeError:
+            parser.error(f"{args.batch} is neither a PDF nor a manifest listing PDFs")
+        documents = [
+            (pdf_file, Path(args.output or ".", Path(pdf_file).stem), pids_file) for pdf_file, pids_file in batch
+        ]
+        if not documents:
+            parser.error(f"no PDFs found for {args.batch}")
+        folders = Counter(str(output_folder) for _, output_folder, _ in documents)
+        duplicates = sorted(
+            pdf_file for pdf_file, output_folder, _ in documents if folders[str(output_folder)] > 1
         )
-        output_path = Path(output_folder, f"{pid}_HOCR.shtml")
-        with codecs.open(output_path, encoding="utf-8", mode="w") as file:
-            file.write(page_html)
+        if duplicates:
+            parser.error("PDFs with the same file name would share an output folder: {}".format(", ".join(duplicates)))
+    else:
+        pdf_file = args.pdf_file
+        if pdf_file == "-":
+            # The name is used for messages and PIDs; worker processes open a spooled file themselves
+            pdf_file = "stdin"
+            stdin_pdf = read_stdin(STDIN_MEMORY_LIMIT if args.workers == 1 and not staged else 0)
+        documents = [(pdf_file, args.output or Path(pdf_file).stem, args.pids)]
+    options = Options(
+        renderer=args.renderer,
+        laparams=args.laparams,
+        compact=args.compact,
+        cache=args.cache,
+        cache_size=args.cache_size * 1024 * 1024,
+        mmap=args.mmap,
+        text_layer=args.text_layer,
+        lean=args.lean,
+        profile=args.profile,
+        profile_slower_than=args.profile_slower_than,
+    )
+    jobs = []
+    for pdf_file, output_folder, pids_file in documents:
+        done = None
+        if args.resume:
+            pids = pids_file and read_pids(pids_file)
+            done = Manifest(output_folder).completed_pages(
+                lambda page_num: page_filename(page_pid(pids, pdf_file, page_num), args.compress)
+            )
+        jobs.append(Job(pdf_file if stdin_pdf is None else stdin_pdf, args.pages, done))
+    run_profiler = None
+    if args.profile and args.profile_slower_than is None:
+        from hocrprofile import RunProfiler, write_profile
+
+        run_profiler = RunProfiler()
+    with run_profiler or nullcontext():
+        if args.batch or args.workers > 1 or staged:
+            failed = extract_parallel(documents, jobs, args, options, run_profiler)
+        else:
+            failed = extract_serial(documents[0], jobs[0], args, options, run_profiler)
+    if run_profiler:
+        profile_folder = args.output or "." if args.batch else documents[0][1]
+        write_profile(run_profiler.stats(), Path(profile_folder, "profile"), " ".join(sys.argv))
+    if failed:
+        logging.getLogger(__name__).error("Extraction failed for: {}".format(", ".join(sorted(failed))))
+        sys.exit(1)
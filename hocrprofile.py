@@ -0,0 +1,179 @@
+import cProfile
+import json
+import pstats
+import sys
+import time
+from pathlib import Path
+
+# Time slices smaller than this share of the whole profile are left out of flame graphs
+MIN_FLAME_SHARE = 0.0005
+MAX_FLAME_DEPTH = 200
+
+class _RawStats:
+    # Lets pstats.Stats load a stats dict returned by a worker process
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+# From Python 3.12, cProfile uses sys.monitoring, which profiles every thread and only lets one profiler run at a time
+PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+# The Profiler enabled in this process, if any. sys.getprofile does not show one from Python 3.12
+_active_profiler = None
+
+class Profiler(cProfile.Profile):
+    """A cProfile.Profile that profiler_active and stop_inherited_profiler know about"""
+
+    def enable(self, *args, **kwargs):
+        global _active_profiler
+        super().enable(*args, **kwargs)
+        _active_profiler = self
+
+    def disable(self):
+        global _active_profiler
+        super().disable()
+        if _active_profiler is self:
+            _active_profiler = None
+
+def profiler_active():
+    return _active_profiler is not None
+
+def stop_inherited_profiler():
+    """Pool initializer: a forked worker inherits the parent's profiler, whose stats would never be collected"""
+    if _active_profiler is not None:
+        _active_profiler.disable()
+
+def merge_stats(stats_dicts):
+    """Combines stats dicts (as in cProfile.Profile.stats) into one pstats.Stats"""
+    merged = None
+    for stats in stats_dicts:
+        if merged is None:
+            merged = pstats.Stats(_RawStats(stats))
+        else:
+            merged.add(_RawStats(stats))
+    return merged
+
+def _frame_name(func):
+    filename, line, name = func
+    return {"name": name, "file": filename, "line": line} if filename != "~" else {"name": name}
+
+def speedscope_profile(stats: pstats.Stats, name: str):
+    """Converts pstats into a speedscope "sampled" profile
+
+    cProfile only records caller/callee pairs, not whole stacks, so stacks are rebuilt from the roots down,
+    splitting each function's cumulative time between its callees in proportion to the time spent in each.
+    """
+    callees = {}
+    for func, (cc, nc, tt, ct, callers) in stats.stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    roots = [
+        func for func, (cc, nc, tt, ct, callers) in stats.stats.items()
+        if not set(callers) - {func}
+    ]
+    total = sum(stats.stats[func][3] for func in roots) or 1.0
+    frames = []
+    frame_index = {}
+    samples = []
+    weights = []
+
+    def frame(func):
+        if func not in frame_index:
+            frame_index[func] = len(frames)
+            frames.append(_frame_name(func))
+        return frame_index[func]
+
+    def walk(func, seconds, stack, on_stack):
+        cc, nc, tt, ct, callers = stats.stats[func]
+        stack = stack + [frame(func)]
+        self_seconds = seconds * (tt / ct) if ct else seconds
+        children = [
+            (callee, seconds * edge_seconds / ct)
+            for callee, edge_seconds in callees.get(func, [])
+            if ct and callee not in on_stack
+        ]
+        if len(stack) < MAX_FLAME_DEPTH:
+            for callee, callee_seconds in children:
+                if callee_seconds / total >= MIN_FLAME_SHARE:
+                    walk(callee, callee_seconds, stack, on_stack | {callee})
+        if self_seconds / total >= MIN_FLAME_SHARE:
+            samples.append(stack)
+            weights.append(self_seconds)
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [], {root})
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "hocrextract",
+        "name": name,
+        "shared": {"frames": frames},
+        "profiles": [{
+            "type": "sampled",
+            "name": name,
+            "unit": "seconds",
+            "startValue": 0,
+            "endValue": sum(weights),
+            "samples": samples,
+            "weights": weights,
+        }],
+    }
+
+def write_profile(stats: pstats.Stats, path_base, name: str):
+    """Writes {path_base}.pstats and {path_base}.speedscope.json"""
+    Path(path_base).parent.mkdir(parents=True, exist_ok=True)
+    stats.dump_stats(f"{path_base}.pstats")
+    with open(f"{path_base}.speedscope.json", "w") as file:
+        json.dump(speedscope_profile(stats, name), file)
+
+class RunProfiler:
+    """Profiles a whole run in this process, together with the stats worker processes send back"""
+
+    def __init__(self):
+        self.profiler = Profiler()
+        self.worker_stats = []
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.disable()
+
+    def add_worker_stats(self, stats):
+        self.worker_stats.append(stats)
+
+    def stats(self):
+        self.profiler.create_stats()
+        return merge_stats([self.profiler.stats] + self.worker_stats)
+
+class PageProfiler:
+    """Profiles each page on its own, from the start of its interpretation until the next page is asked for
+
+    Only pages slower than threshold seconds are kept, in slow_pages as page_num -> (seconds, stats dict).
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.slow_pages = {}
+
+    def iter_pages(self, pages):
+        pages = iter(pages)
+        while True:
+            profiler = Profiler()
+            start = time.perf_counter()
+            profiler.enable()
+            try:
+                page_num = next(pages)
+            except StopIteration:
+                profiler.disable()
+                return
+            try:
+                yield page_num
+            finally:
+                profiler.disable()
+            seconds = time.perf_counter() - start
+            if seconds > self.threshold:
+                profiler.create_stats()
+                self.slow_pages[page_num] = (seconds, profiler.stats)
@@ -0,0 +1,65 @@
+from pdfminer.layout import LTImage
+from pdftotree.utils.pdf.pdf_utils import CustomPDFPageAggregator
+
+class LeanPageAggregator(CustomPDFPageAggregator):
+    """CustomPDFPageAggregator that, with lean, drops the graphics and image data hOCR never uses as it draws them
+
+    Building the tree only uses lines and curves for the width of the page's content (get_page_width): table
+    candidates count them as features, which are thrown away. So of the lines and curves drawn in each page or
+    figure, only the leftmost and rightmost are kept, and a path that cannot extend them is not built at all.
+    Images keep their size for the scale factor, but not their stream, and the stream's raw data is dropped
+    even when the document caches it, as pdfminer never decodes images.
+    The text, figures and trees are the same as without lean; elems has fewer segments and curves.
+    """
+
+    def __init__(self, rsrcmgr, pageno=1, laparams=None, lean=False):
+        super().__init__(rsrcmgr, pageno=pageno, laparams=laparams)
+        self.lean = lean
+        # id(page or figure) -> [leftmost, rightmost] line or curve drawn in it
+        self.kept_paths = {}
+
+    def paint_path(self, gstate, stroke, fill, evenodd, path):
+        if not self.lean:
+            return super().paint_path(gstate, stroke, fill, evenodd, path)
+        container = self.cur_item
+        kept = self.kept_paths.get(id(container))
+        if kept is not None:
+            # The x of every point, as paint_single_path transforms them
+            a, b, c, d, e, f = self.ctm
+            xs = [a * p[i] + c * p[i + 1] + e for p in path for i in range(1, len(p), 2)]
+            if not xs or (kept[0].x0 <= min(xs) and max(xs) <= kept[1].x1):
+                return
+        start = len(container._objs)
+        super().paint_path(gstate, stroke, fill, evenodd, path)
+        for obj in container._objs[start:]:
+            if kept is None:
+                kept = self.kept_paths[id(container)] = [obj, obj]
+                continue
+            if obj.x0 < kept[0].x0:
+                kept[0] = obj
+            if obj.x1 > kept[1].x1:
+                kept[1] = obj
+        del container._objs[start:]
+
+    def add_kept_paths(self, container):
+        kept = self.kept_paths.pop(id(container), None)
+        if kept is not None:
+            container.add(kept[0])
+            if kept[1] is not kept[0]:
+                container.add(kept[1])
+
+    def end_figure(self, name):
+        self.add_kept_paths(self.cur_item)
+        super().end_figure(name)
+
+    def end_page(self, page):
+        self.add_kept_paths(self.cur_item)
+        super().end_page(page)
+
+    def render_image(self, name, stream):
+        super().render_image(name, stream)
+        if self.lean:
+            image = self.cur_item._objs[-1]
+            if isinstance(image, LTImage):
+                image.stream = None
+            stream.rawdata = b""
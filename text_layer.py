@@ -0,0 +1,54 @@
+from lean_aggregator import LeanPageAggregator
+from pdfminer.layout import LTChar, LTPage, LTTextLineHorizontal
+
+class TextLayerAggregator(LeanPageAggregator):
+    """Groups the characters drawn by each text-showing operator into lines as they are drawn
+
+    OCR software writes its text layer word by word or line by line, so instead of pdfminer's layout analysis
+    of every character on the page, each operator's characters are added to the current line, and a new line
+    is started when they are not on the same line as the previous ones by pdfminer's own test.
+    Text in figures is left as pdfminer leaves it without all_texts.
+    """
+
+    def begin_page(self, page, ctm):
+        super().begin_page(page, ctm)
+        self.lines = []
+
+    def render_string(self, textstate, seq, ncs, graphicstate):
+        page = self.cur_item
+        if not isinstance(page, LTPage):
+            return super().render_string(textstate, seq, ncs, graphicstate)
+        start = len(page._objs)
+        super().render_string(textstate, seq, ncs, graphicstate)
+        chars = page._objs[start:]
+        if not chars:
+            return
+        del page._objs[start:]
+        line = self.lines[-1] if self.lines else None
+        if line is None or not self.same_line(line._objs[-1], chars[0]):
+            line = LTTextLineHorizontal(self.laparams.word_margin)
+            self.lines.append(line)
+        for char in chars:
+            line.add(char)
+
+    def same_line(self, obj0: LTChar, obj1: LTChar):
+        # The halign test of LTLayoutContainer.group_objects
+        laparams = self.laparams
+        return (
+            obj0.is_voverlap(obj1)
+            and min(obj0.height, obj1.height) * laparams.line_overlap < obj0.voverlap(obj1)
+            and obj0.hdistance(obj1) < max(obj0.width, obj1.width) * laparams.char_margin
+        )
+
+    def end_page(self, page):
+        assert not self._stack, str(len(self._stack))
+        layout = self.cur_item
+        self.add_kept_paths(layout)
+        for obj in layout:
+            obj.analyze(self.laparams)
+        for line in self.lines:
+            line.analyze(self.laparams)
+        layout._objs = self.lines + layout._objs
+        self.lines = []
+        self.pageno += 1
+        self.receive_layout(layout)
@@ -0,0 +1,600 @@
+import hashlib
+import html
+import io
+import logging
+import mmap
+import numpy as np
+import os
+import pdfminer
+import pdftotree
+import pickle
+import time
+import tabula
+from box_order import sort_elems, sort_order
+from lean_aggregator import LeanPageAggregator
+from pathlib import Path
+from typing import List
+from pdfminer.layout import LAParams, LTChar, LTContainer, LTPage, LTFigure, LTImage, LTTextLine
+from pdfminer.pdfdocument import PDFDocument
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+from pdfminer.pdfparser import PDFParser
+from pdftotree import TreeExtract
+from pdftotree.ml.features import get_mentions_within_bbox
+from pdftotree.utils.pdf.pdf_parsers import parse_tree_structure
+from text_layer import TextLayerAggregator
+from xml.dom.minidom import Document
+
+# Named LAParams, from cheapest to most thorough layout analysis; "default" is what pages were always analysed with
+LAPARAMS_PROFILES = {
+    # No vertical text, and text boxes are ordered by position instead of grouped hierarchically
+    "fast": {"char_margin": 1.0, "word_margin": 0.1, "detect_vertical": False, "boxes_flow": None},
+    "default": {"char_margin": 1.0, "word_margin": 0.1, "detect_vertical": True},
+    # Text inside figures (form XObjects) is grouped into lines as well, instead of by runs of the same font
+    "accurate": {"char_margin": 1.0, "word_margin": 0.1, "detect_vertical": True, "all_texts": True},
+}
+
+def _escape(data: str):
+    # Same escaping as xml.dom.minidom uses for text and attribute values
+    return data.replace("&", "&amp;").replace("<", "&lt;").replace("\"", "&quot;").replace(">", "&gt;")
+
+class HocrWriter:
+    """Writes elements straight to a text file, laid out as Document.toprettyxml() lays them out"""
+
+    def __init__(self, file, indent="\t", newl="\n"):
+        self.file = file
+        self.indent = indent
+        self.newl = newl
+        self.depth = 0
+
+    def declaration(self):
+        self.file.write(f'<?xml version="1.0" ?>{self.newl}')
+
+    def _open_tag(self, tag: str, attrs):
+        self.file.write(self.indent * self.depth + "<" + tag + "".join(
+            f' {name}="{_escape(value)}"' for name, value in attrs
+        ))
+
+    def start(self, tag: str, attrs=()):
+        self._open_tag(tag, attrs)
+        self.file.write(">" + self.newl)
+        self.depth += 1
+
+    def end(self, tag: str):
+        self.depth -= 1
+        self.file.write(f"{self.indent * self.depth}</{tag}>{self.newl}")
+
+    def empty(self, tag: str, attrs=()):
+        self._open_tag(tag, attrs)
+        self.file.write("/>" + self.newl)
+
+    def text(self, tag: str, attrs, text: str):
+        self._open_tag(tag, attrs)
+        self.file.write(f">{_escape(text)}</{tag}>{self.newl}")
+
+def _drop_image_streams(obj):
+    # Image data is not needed once the scale factor is known, and would bloat the cache
+    if isinstance(obj, LTImage):
+        obj.stream = None
+    if isinstance(obj, LTContainer):
+        for child in obj:
+            _drop_image_streams(child)
+
+class PageBoxes:
+    """The boxes of a page's tree in reading order, as one structured array of label index and bbox
+
+    Built once per page from the tree, so rendering does not rebuild and sort a list of lists each time.
+    """
+    __slots__ = ("labels", "array")
+
+    DTYPE = np.dtype([
+        ("label", np.uint8),
+        ("top", np.float64),
+        ("left", np.float64),
+        ("bottom", np.float64),
+        ("right", np.float64),
+    ])
+
+    def __init__(self, tree_page):
+        # Tree clusters are names like "Section Header", written as the pdftotree attribute "section_header"
+        self.labels = [clust.lower().replace(" ", "_") for clust in tree_page]
+        array = np.empty(sum(len(x) for x in tree_page.values()), dtype=self.DTYPE)
+        start = 0
+        for label, boxes in enumerate(tree_page.values()):
+            if not boxes:
+                continue
+            # Each box is (page_num, page_width, page_height, top, left, bottom, right)
+            array[start:start + len(boxes)] = [(label, *box[3:7]) for box in boxes]
+            start += len(boxes)
+        self.array = array[sort_order(array["top"], array["left"], array["bottom"])]
+
+    def __len__(self):
+        return len(self.array)
+
+    def __iter__(self):
+        """Yields (label, [top, left, bottom, right]) per box"""
+        labels = self.labels
+        for label, top, left, bottom, right in self.array.tolist():
+            yield labels[label], [top, left, bottom, right]
+
+class LayoutCache:
+    """On-disk cache of normalized pages (elems and font stats), keyed by PDF content, page number, LAParams
+    and the aggregator modes (text layer, lean)
+
+    Entries are files in folder; the least recently used ones are removed once they add up to more than max_bytes.
+    The folder is only counted on the first put, and again once this instance has written a RECOUNT_SHARE of
+    max_bytes since, so other processes' entries are noticed without counting the folder for every page.
+    """
+    RECOUNT_SHARE = 1 / 16
+
+    def __init__(self, folder, max_bytes: int):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.size = None
+        # Bytes put since the folder was last counted
+        self.uncounted = 0
+
+    def key(self, pdf_hash: str, page_num: int, laparams: LAParams, text_layer=False, lean=False):
+        params = repr(sorted(vars(laparams).items()))
+        # Modes are only added when set, so entries written without them keep their keys
+        params += "".join(f" {mode}" for mode, used in (("text layer", text_layer), ("lean", lean)) if used)
+        versions = f"pdfminer {pdfminer.__version__} pdftotree {pdftotree.__version__}"
+        return hashlib.sha256(f"{versions}|{pdf_hash}|{page_num}|{params}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str):
+        path = self.folder / f"{key}.pickle"
+        try:
+            with open(path, "rb") as file:
+                value = pickle.load(file)
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            return None
+        except Exception:
+            logging.getLogger(__name__).warning("Ignoring unreadable cache entry {}".format(path), exc_info=True)
+            return None
+        return value
+
+    def put(self, key: str, value):
+        elems, font_stat = value
+        _drop_image_streams(elems.layout)
+        try:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            logging.getLogger(__name__).warning("Unable to cache a page", exc_info=True)
+            return
+        path = self.folder / f"{key}.pickle"
+        partial_path = self.folder / f"{key}.{os.getpid()}.partial"
+        with open(partial_path, "wb") as file:
+            file.write(data)
+        os.replace(partial_path, path)
+        self.uncounted += len(data)
+        if self.size is None or self.uncounted > self.max_bytes * self.RECOUNT_SHARE:
+            self.count()
+        else:
+            self.size += len(data)
+        if self.size > self.max_bytes:
+            self.evict()
+
+    def count(self):
+        self.size = sum(x[1] for x in self._entries())
+        self.uncounted = 0
+
+    def _entries(self):
+        for path in self.folder.glob("*.pickle"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue  # evicted by another process
+            yield stat.st_mtime, stat.st_size, path
+
+    def evict(self):
+        entries = sorted(self._entries())
+        self.size = sum(x[1] for x in entries)
+        self.uncounted = 0
+        for mtime, size, path in entries:
+            if self.size <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            self.size -= size
+
+def read_pdf_source(source):
+    """Returns a PDF given as a path as is, and one given as bytes or a binary file object as bytes"""
+    if isinstance(source, (str, os.PathLike)):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    return source.read()
+
+def open_pdf(source, use_mmap=False):
+    """Opens a PDF given as a path or as bytes for reading
+
+    With use_mmap, a path is memory-mapped read-only: pdfminer's seeks and reads are then served from the page
+    cache without system calls, and processes mapping the same file share its pages.
+    """
+    if isinstance(source, bytes):
+        return io.BytesIO(source)
+    if use_mmap:
+        with open(os.path.realpath(source), "rb") as fp:
+            return mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    return open(os.path.realpath(source), "rb")
+
+def hash_pdf(source, use_mmap=False):
+    """Returns the sha256 of a PDF given as a path or as bytes, as a hex string"""
+    digest = hashlib.sha256()
+    with open_pdf(source, use_mmap) as fp:
+        for block in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class CustomTreeExtractor(TreeExtract.TreeExtractor):
+    """Extracts HOCR info to separate files and scales based on the size of the bg image
+
+    pdf_file is a path, the PDF as bytes, or a binary file object, which is read once.
+    """
+
+    def __init__(self, pdf_file):
+        # A path, or the bytes of the PDF
+        self.pdf_source = read_pdf_source(pdf_file)
+        in_memory = isinstance(self.pdf_source, bytes)
+        # tabula reads tables from pdf_file: a path, or a file object it copies to a temporary file
+        super().__init__(io.BytesIO(self.pdf_source) if in_memory else pdf_file)
+        # For log messages
+        self.name = str(getattr(pdf_file, "name", "<bytes>")) if in_memory else str(pdf_file)
+        # Carried from page to page by parse_tree_structure
+        self.ref_page_seen = False
+        # Pages after this one start with ref_page_seen set, when the pages that set it are not extracted again
+        self.ref_page_seen_after = None
+        # Set parameters for analysis.
+        self.laparams = LAParams(**LAPARAMS_PROFILES["default"])
+        # Optional LayoutCache of normalized pages
+        self.cache = None
+        # page_num -> seconds spent per stage, for run reports
+        self.timings = {}
+        # page_num -> PageBoxes, built along with the tree
+        self.page_boxes = {}
+        # The last page whose tree was built, as trees must be built in page order
+        self.last_tree_page = 0
+        # Memory-map the PDF instead of reading it through a file object
+        self.use_mmap = False
+        # Read lines straight from the text-showing operators of the OCR text layer, without layout analysis
+        self.text_layer = False
+        # Drop the lines, curves and image data that the tree and hOCR do not use as soon as they are drawn
+        self.lean = False
+        # sha256 of the PDF for cache keys, hashed on first use unless whoever made the extractor already knows it
+        self.known_pdf_hash = None
+
+    def parse(self):
+        for page_num in self.iter_parse():
+            pass
+
+    def iter_parse(self, pages=None, caching=True):
+        """Interprets and normalizes one page at a time, yielding each page number once its elems are stored
+
+        If pages is given, only those (1-based) page numbers are interpreted.
+        """
+        log = logging.getLogger(__name__)
+        if pages is not None:
+            pages = set(pages)
+            last_page = max(pages, default=0)
+
+        # Open a PDF file.
+        with open_pdf(self.pdf_source, self.use_mmap) as fp:
+            # Create a PDF parser object associated with the file object.
+            parser = PDFParser(fp)
+            # Create a PDF document object that stores the document structure.
+            # Supply the password for initialization.
+            # Without caching, resolved objects (e.g. image streams) are not kept for the whole document.
+            document = PDFDocument(parser, password="", caching=caching)
+            # Create a PDF resource manager object that stores shared resources.
+            rsrcmgr = PDFResourceManager()
+            # Create a PDF page aggregator object.
+            aggregator = TextLayerAggregator if self.text_layer else LeanPageAggregator
+            device = aggregator(rsrcmgr, laparams=self.laparams, lean=self.lean)
+            # Create a PDF interpreter object.
+            interpreter = PDFPageInterpreter(rsrcmgr, device)
+            # Process each page contained in the document.
+            for page_num, page in enumerate(PDFPage.create_pages(document), start=1):
+                if pages is not None:
+                    if page_num > last_page:
+                        break
+                    if page_num not in pages:
+                        continue
+                start = time.perf_counter()
+                cache_key = self.cache and self.cache.key(
+                    self.pdf_hash(), page_num, self.laparams, self.text_layer, self.lean
+                )
+                cached = cache_key and self.cache.get(cache_key)
+                if cached:
+                    self.elems[page_num], self.font_stats[page_num] = cached
+                    self.timings[page_num] = {"cache": time.perf_counter() - start}
+                    yield page_num
+                    continue
+                try:
+                    interpreter.process_page(page)
+                except OverflowError as oe:
+                    log.exception(
+                        "{}, skipping page {} of {}".format(oe, page_num, self.name)
+                    )
+                    continue
+                layout = device.get_result()
+                interpreted = time.perf_counter()
+                elems, font_stat = self.normalize_page(device, layout)
+                self.elems[page_num] = elems
+                self.font_stats[page_num] = font_stat
+                self.timings[page_num] = {
+                    "interpret": interpreted - start,
+                    "normalize": time.perf_counter() - interpreted,
+                }
+                if cache_key:
+                    self.cache.put(cache_key, (elems, font_stat))
+                yield page_num
+
+    def pdf_hash(self):
+        if self.known_pdf_hash is None:
+            self.known_pdf_hash = hash_pdf(self.pdf_source, self.use_mmap)
+        return self.known_pdf_hash
+
+    def normalize_page(self, device, layout: LTPage):
+        bg_figure = next(x for x in layout._objs if isinstance(x, LTFigure) and x.width == layout.width)
+        bg_image = next(x for x in bg_figure._objs if isinstance(x, LTImage))
+        scale_factor = bg_image.srcsize[0] / layout.width
+        return device.normalize_pdf(layout, scale_factor)
+
+    def get_tree_for_page(self, page_num: int):
+        """Builds the tree of a single page, as get_tree_structure(None, None) does for every page"""
+        if self.ref_page_seen_after is not None and page_num > self.ref_page_seen_after:
+            self.ref_page_seen = True
+        start = time.perf_counter()
+        tables = self.get_tables_page_num(page_num)
+        self.tree[page_num], self.ref_page_seen = parse_tree_structure(
+            self.elems[page_num],
+            self.font_stats[page_num],
+            page_num,
+            self.ref_page_seen,
+            tables,
+        )
+        self.page_boxes[page_num] = PageBoxes(self.tree[page_num])
+        self.last_tree_page = page_num
+        self.timings.setdefault(page_num, {})["tree"] = time.perf_counter() - start
+        return self.tree[page_num]
+
+    def get_tree_structure(self, model_type, model):
+        tree = super().get_tree_structure(model_type, model)
+        for page_num, tree_page in tree.items():
+            self.page_boxes[page_num] = PageBoxes(tree_page)
+        self.last_tree_page = max(tree, default=self.last_tree_page)
+        return tree
+
+    def page_counts(self, page_num: int):
+        elems = self.elems[page_num]
+        return {
+            "chars": sum(1 for x in elems.chars if isinstance(x, LTChar)),
+            "text_lines": len(elems.mentions),
+            "figures": len(elems.figures),
+            "boxes": len(self.page_boxes.get(page_num, ())),
+        }
+
+    def iter_pages(self, pages=None):
+        """Yields each page number once its tree is built, dropping the page once the caller is done with it"""
+        for page_num in self.iter_parse(pages, caching=False):
+            self.get_tree_for_page(page_num)
+            yield page_num
+            self.free_page(page_num)
+
+    def pop_parsed_page(self, page_num: int):
+        """Removes an interpreted page, returning it as (elems, font_stat, timings) without image data, to be pickled"""
+        elems = self.elems.pop(page_num)
+        _drop_image_streams(elems.layout)
+        return elems, self.font_stats.pop(page_num), self.timings.pop(page_num, {})
+
+    def add_parsed_page(self, page_num: int, page):
+        """Adds a page returned by pop_parsed_page, possibly of another extractor, to be rendered by this one"""
+        elems, font_stat, timings = page
+        self.elems[page_num] = elems
+        self.font_stats[page_num] = font_stat
+        self.timings[page_num] = dict(timings)
+
+    def iter_parsed_pages(self):
+        """Yields the pages parse() interpreted in order, dropping each page once the caller is done with it
+
+        Their trees are built as they are rendered, so nothing waits for the trees of the whole document.
+        """
+        for page_num in sorted(self.elems):
+            yield page_num
+            self.free_page(page_num)
+
+    def free_page(self, page_num: int):
+        self.elems.pop(page_num, None)
+        self.font_stats.pop(page_num, None)
+        self.tree.pop(page_num, None)
+        self.page_boxes.pop(page_num, None)
+        self.timings.pop(page_num, None)
+
+    def get_page_boxes(self, page_num: int):
+        """Returns the boxes of a page, building its tree first if needed
+
+        As parse_tree_structure carries ref_page_seen from page to page, the trees of earlier pages that are not
+        built yet are built before it, and kept until those pages are rendered or freed.
+        """
+        if page_num not in self.page_boxes:
+            for earlier in sorted(x for x in self.elems if self.last_tree_page < x < page_num):
+                self.get_tree_for_page(earlier)
+            self.get_tree_for_page(page_num)
+        return self.page_boxes[page_num]
+
+    def get_html_for_page(self, page_num: int, compact=False):
+        doc = Document()
+        self.doc = doc
+        html = doc.createElement("html")
+        doc.appendChild(html)
+        html.setAttribute("xmlns", "http://www.w3.org/1999/xhtml")
+        head = doc.createElement("head")
+        html.appendChild(head)
+        # meta
+        meta = doc.createElement("meta")
+        head.appendChild(meta)
+        meta.setAttribute("name", "ocr-system")
+        meta.setAttribute("content", f"Extracted from PDF by hocrextract/pdftotree {pdftotree.__version__}")
+        meta = doc.createElement("meta")
+        head.appendChild(meta)
+        meta.setAttribute("name", "ocr-capabilities")
+        meta.setAttribute("content", "ocr_page ocr_table ocrx_block ocrx_word")
+        # body
+        body = doc.createElement("body")
+        html.appendChild(body)
+        page = doc.createElement("div")
+        page.setAttribute("class", "ocr_page")
+        page.setAttribute("id", "page_1")
+        width = int(self.elems[page_num].layout.width)
+        height = int(self.elems[page_num].layout.height)
+        page.setAttribute(
+            "title",
+            f"bbox 0 0 {width} {height}; ppageno 0",
+        )
+        body.appendChild(page)
+
+        for label, box in self.get_page_boxes(page_num):
+            if label == "table":
+                table_element = self.get_html_table(box, page_num)
+                page.appendChild(table_element)
+            elif label == "figure":
+                fig_element = doc.createElement("figure")
+                page.appendChild(fig_element)
+                top, left, bottom, right = [int(i) for i in box]
+                fig_element.setAttribute(
+                    "title", f"bbox {left} {top} {right} {bottom}"
+                )
+            else:
+                element = self.get_html_others(label, box, page_num)
+                page.appendChild(element)
+        return doc.toxml() if compact else doc.toprettyxml()
+
+    def write_html_for_page(self, page_num: int, file, compact=False):
+        """Writes the same hOCR as get_html_for_page straight to file, without building a DOM"""
+        writer = HocrWriter(file, indent="", newl="") if compact else HocrWriter(file)
+        writer.declaration()
+        writer.start("html", [("xmlns", "http://www.w3.org/1999/xhtml")])
+        writer.start("head")
+        writer.empty("meta", [
+            ("name", "ocr-system"),
+            ("content", f"Extracted from PDF by hocrextract/pdftotree {pdftotree.__version__}"),
+        ])
+        writer.empty("meta", [
+            ("name", "ocr-capabilities"),
+            ("content", "ocr_page ocr_table ocrx_block ocrx_word"),
+        ])
+        writer.end("head")
+        writer.start("body")
+        width = int(self.elems[page_num].layout.width)
+        height = int(self.elems[page_num].layout.height)
+        page_attrs = [
+            ("class", "ocr_page"),
+            ("id", "page_1"),
+            ("title", f"bbox 0 0 {width} {height}; ppageno 0"),
+        ]
+        boxes = self.get_page_boxes(page_num)
+        if not boxes:
+            writer.empty("div", page_attrs)
+        else:
+            writer.start("div", page_attrs)
+            for label, box in boxes:
+                if label == "table":
+                    self.write_html_table(writer, box, page_num)
+                elif label == "figure":
+                    top, left, bottom, right = [int(i) for i in box]
+                    writer.empty("figure", [("title", f"bbox {left} {top} {right} {bottom}")])
+                else:
+                    self.write_html_others(writer, label, box, page_num)
+            writer.end("div")
+        writer.end("body")
+        writer.end("html")
+
+    def write_html_others(self, writer, tag: str, box: List[float], page_num: int):
+        top, left, bottom, right = [int(x) for x in box]
+        attrs = [
+            ("class", "ocrx_block"),
+            ("pdftotree", tag),  # for backward-compatibility
+            ("title", f"bbox {left} {top} {right} {bottom}"),
+        ]
+        elems = get_mentions_within_bbox(box, self.elems[page_num].mentions)
+        if not elems:
+            writer.empty("div", attrs)
+            return
+        sort_elems(elems)
+        writer.start("div", attrs)
+        for elem in elems:
+            self.write_html_line(
+                writer,
+                f"bbox {int(elem.x0)} {int(elem.y0)} {int(elem.x1)} {int(elem.y1)}",
+                elem,
+            )
+        writer.end("div")
+
+    def write_html_table(self, writer, table: List[float], page_num: int):
+        table_json = tabula.read_pdf(
+            self.pdf_file, pages=page_num, area=table, output_format="json"
+        )
+        if len(table_json) == 0:
+            return
+        top = int(table_json[0]["top"])
+        left = int(table_json[0]["left"])
+        bottom = int(table_json[0]["bottom"])
+        right = int(table_json[0]["right"])
+        attrs = [("class", "ocr_table"), ("title", f"bbox {left} {top} {right} {bottom}")]
+        rows = table_json[0]["data"]
+        if not rows:
+            writer.empty("table", attrs)
+            return
+        writer.start("table", attrs)
+        for row in rows:
+            if not row:
+                writer.empty("tr")
+                continue
+            writer.start("tr")
+            for cell in row:
+                box: List[float] = [
+                    cell["top"],
+                    cell["left"],
+                    cell["top"] + cell["height"],
+                    cell["left"] + cell["width"],
+                ]
+                elems = get_mentions_within_bbox(box, self.elems[page_num].mentions)
+                if len(elems) == 0:
+                    writer.empty("td")
+                    continue
+                writer.start("td", [
+                    ("title", f"bbox {int(box[1])} {int(box[0])} {int(box[3])} {int(box[2])}"),
+                ])
+                sort_elems(elems)
+                for elem in elems:
+                    self.write_html_line(
+                        writer,
+                        " ".join(["bbox"] + [str(int(_)) for _ in elem.bbox]),
+                        elem,
+                    )
+                writer.end("td")
+            writer.end("tr")
+        writer.end("table")
+
+    def write_html_line(self, writer, title: str, elem: LTTextLine):
+        attrs = [("class", "ocrx_line"), ("title", title)]
+        words = self.get_word_boundaries(elem)
+        if not words:
+            writer.empty("span", attrs)
+            return
+        writer.start("span", attrs)
+        for word in words:
+            top, left, bottom, right = [int(x) for x in word[1:]]
+            # escape special HTML chars
+            writer.text(
+                "span",
+                [("class", "ocrx_word"), ("title", f"bbox {left} {top} {right} {bottom}")],
+                html.escape(word[0]),
+            )
+        writer.end("span")
+
+def count_pages(pdf_file, use_mmap=False):
+    with open_pdf(pdf_file, use_mmap) as fp:
+        document = PDFDocument(PDFParser(fp), password="", caching=False)
+        return sum(1 for _ in PDFPage.create_pages(document))